@@ -18,7 +18,12 @@ from keyboards import (
     get_cancel_kb, get_confirmation_kb, get_quality_kb,
     get_edit_movie_fields_kb, get_broadcast_kb
 )
-from utils import format_movie_info, format_number, create_progress_bar 
+from utils import (
+    format_movie_info, format_number, create_progress_bar,
+    membership_cache, membership_store, get_channel_invite_link,
+    format_stats_age, get_bot_username, inline_results_cache, forget_channel,
+    caption_cache
+)
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -63,17 +68,16 @@ async def admin_panel(message: Message, state: FSMContext, db: Database):
     """Admin panel va statistika"""
     await state.clear()
     
-    stats = await db.get_global_stats()
-    active_users = await db.get_active_users_count(7)
-    channels_count = await db.count_required_channels()
+    stats = await db.get_admin_stats()
     
     text = (
         "🛠 <b>Admin Panel</b>\n\n"
         f"👥 Jami foydalanuvchilar: {format_number(stats['users_count'])}\n"
-        f"🟢 Aktiv (7 kun): {format_number(active_users)}\n"
+        f"🟢 Aktiv (7 kun): {format_number(stats['active_7'])}\n"
         f"🎬 Jami kinolar: {format_number(stats['movies_count'])}\n"
         f"👁 Jami ko'rishlar: {format_number(stats['total_views'])}\n"
-        f"🔗 Majburiy kanal soni: {channels_count}\n\n"
+        f"🔗 Majburiy kanal soni: {stats['channels_count']}\n"
+        f"🔄 {format_stats_age(stats['refreshed_at'])}\n\n"
         f"Quyidagi amallardan birini tanlang:"
     )
     
@@ -271,14 +275,14 @@ async def finalize_movie(message: Message, state: FSMContext, db: Database, bot:
         return
     
     # Kanalga post yuborish logikasi
-    bot_info = await bot.get_me()
+    bot_username = await get_bot_username(bot)
     rating = await db.get_movie_rating(movie.id)
     post_text = format_movie_info(movie, rating)
     post_text += f"\n\n👇 Kinoni olish uchun botga o'ting:"
     
     from aiogram.utils.keyboard import InlineKeyboardBuilder
     kb = InlineKeyboardBuilder()
-    kb.button(text="🎬 Kinoni olish", url=f"https://t.me/{bot_info.username}?start=code_{movie.code}")
+    kb.button(text="🎬 Kinoni olish", url=f"https://t.me/{bot_username}?start=code_{movie.code}")
     
     try:
         if thumbnail_file_id:
@@ -471,6 +475,8 @@ async def edit_movie_value_input(message: Message, state: FSMContext, db: Databa
     # Baza ma'lumotini yangilash
     update_data = {edit_field: new_value}
     await db.update_movie(movie_id, **update_data)
+    # Versiya oshgani uchun eski caption baribir ishlatilmaydi — joyini bo'shatamiz
+    caption_cache.pop(movie_id)
     
     if edit_field == 'code':
         await state.update_data(movie_code=new_value)
@@ -542,7 +548,8 @@ async def delete_movie_execute(call: CallbackQuery, state: FSMContext, db: Datab
     movie_title = data['movie_title']
     movie_code = data['movie_code']
     
-    await db.delete_movie(movie_id) 
+    await db.delete_movie(movie_id)
+    caption_cache.pop(movie_id)
     
     await state.clear()
     
@@ -580,22 +587,48 @@ async def get_stats(call: CallbackQuery, db: Database):
     await call.message.edit_text("⏳ Statistika yig'ilmoqda...")
 
     try:
-        global_stats = await db.get_global_stats()
-        active_users_7 = await db.get_active_users_count(7)
-        active_users_30 = await db.get_active_users_count(30)
-        channels_count = await db.count_required_channels()
+        stats = await db.get_admin_stats()
+        fsub_cache = membership_cache.stats()
+        fsub_store = membership_store.stats()
+        movie_cache = db.movie_cache_stats()
+        view_buffer = db.view_buffer.stats()
+        catalog = db.catalog.stats()
+        inline_cache = inline_results_cache.stats()
+        captions = caption_cache.stats()
 
         text = (
             "📈 <b>Bot Statistikasi</b>\n\n"
             "👥 <b>Foydalanuvchilar:</b>\n"
-            f"  • Jami: <code>{format_number(global_stats['users_count'])}</code>\n"
-            f"  • Aktiv (7 kun): <code>{format_number(active_users_7)}</code>\n"
-            f"  • Aktiv (30 kun): <code>{format_number(active_users_30)}</code>\n\n"
+            f"  • Jami: <code>{format_number(stats['users_count'])}</code>\n"
+            f"  • Aktiv (7 kun): <code>{format_number(stats['active_7'])}</code>\n"
+            f"  • Aktiv (30 kun): <code>{format_number(stats['active_30'])}</code>\n\n"
             "🎬 <b>Kinolar & Ko'rishlar:</b>\n"
-            f"  • Jami kinolar: <code>{format_number(global_stats['movies_count'])}</code>\n"
-            f"  • Jami ko'rishlar: <code>{format_number(global_stats['total_views'])}</code>\n\n"
+            f"  • Jami kinolar: <code>{format_number(stats['movies_count'])}</code>\n"
+            f"  • Jami ko'rishlar: <code>{format_number(stats['total_views'])}</code>\n\n"
             f"🔗 <b>Kanallar:</b>\n"
-            f"  • Majburiy kanal soni: <code>{channels_count}</code>"
+            f"  • Majburiy kanal soni: <code>{stats['channels_count']}</code>\n\n"
+            "🧠 <b>Kesh:</b>\n"
+            f"  • Obuna keshi: <code>{fsub_cache['size']}</code> yozuv, "
+            f"hit <code>{fsub_cache['hit_ratio']:.0%}</code> "
+            f"({fsub_cache['hits']}/{fsub_cache['hits'] + fsub_cache['misses']})\n"
+            f"  • Lokal a'zolik jadvali: <code>{format_number(fsub_store['members'])}</code> a'zo, "
+            f"<code>{format_number(fsub_store['left'])}</code> chiqib ketgan, "
+            f"<code>{format_number(fsub_store['unverified'])}</code> qayta tekshiriladi\n"
+            f"  • Kino keshi: <code>{movie_cache['size']}/{movie_cache['maxsize']}</code>, "
+            f"hit <code>{movie_cache['hit_ratio']:.0%}</code>\n"
+            f"  • Qidiruv indeksi: <code>{format_number(catalog['movies'])}</code> kino, "
+            f"<code>{format_number(catalog['postings'])}</code> posting\n"
+            f"  • Inline natijalar keshi: <code>{inline_cache['size']}</code> so'rov, "
+            f"hit <code>{inline_cache['hit_ratio']:.0%}</code>\n"
+            f"  • Caption keshi: <code>{captions['size']}/{captions['maxsize']}</code>, "
+            f"hit <code>{captions['hit_ratio']:.0%}</code>\n\n"
+            "📝 <b>Ko'rishlar buferi:</b>\n"
+            f"  • Navbatda: <code>{view_buffer['pending']}</code>, "
+            f"tashlab yuborilgan: <code>{view_buffer['dropped_rows']}</code>\n"
+            f"  • Oxirgi yozish: <code>{view_buffer['last_flush_size']}</code> qator, "
+            f"kechikish <code>{view_buffer['last_flush_lag']}s</code> "
+            f"(maks <code>{view_buffer['max_flush_lag']}s</code>)\n\n"
+            f"🔄 {format_stats_age(stats['refreshed_at'])}"
         )
         
         await call.bot.edit_message_text(
@@ -798,6 +831,7 @@ async def fsub_add_channel_save(message: Message, state: FSMContext, db: Databas
     try:
         chat = await bot.get_chat(channel_id_or_username)
         final_channel_id = chat.id
+        invite_link = await get_channel_invite_link(bot, chat)
     except TelegramBadRequest:
         await message.answer("❌ Kanal topilmadi yoki bot u yerda admin emas. Botni kanalga Admin qilib qo'yganingizga ishonch hosil qiling!")
         return
@@ -808,7 +842,8 @@ async def fsub_add_channel_save(message: Message, state: FSMContext, db: Databas
     try:
         await db.add_required_channel(
             channel_id=final_channel_id, 
-            title=channel_title
+            title=channel_title,
+            invite_link=invite_link
         )
         await message.answer(
             f"✅ Kanal muvaffaqiyatli qo'shildi:\n"
@@ -854,6 +889,7 @@ async def fsub_delete_channel_save(message: Message, state: FSMContext, db: Data
         return
     
     await db.delete_required_channel(channel_id)
+    forget_channel(channel_id)
     
     await message.answer(
         f"✅ Kanal (ID: <code>{channel_id}</code>) ro'yxatdan muvaffaqiyatli o'chirildi!",
@@ -0,0 +1,152 @@
+"""
+Qidiruv benchmarki: search_movies kechikishini pg_trgm indekslari bilan va ularsiz o'lchaydi.
+
+Ishlatish:
+    python bench_search.py --url postgresql+asyncpg://... --rows 100000 > bench_output.txt
+
+Benchmark kinolarini code >= BENCH_CODE_START bilan qo'shadi va oxirida o'chiradi
+(--keep berilsa qoldiradi). Alohida sinov bazasida ishga tushirish tavsiya etiladi.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import delete, insert, select, text
+
+from config import config
+from database import Database, Movie, movie_search_fields
+
+BENCH_CODE_START = 10 ** 12
+
+# Haqiqiy katalogga o'xshash: ko'p noyob so'zlar va bir nechta mashhur nomlar
+SYLLABLES = [c + v for c in "bdfghjklmnprstvyz" for v in "aeiou"] + ["sh", "ch", "ng", "q", "x"]
+FAMOUS = [
+    "Avengers Endgame", "Avengers Infinity War", "The Dark Knight", "Interstellar", "Inception",
+    "Gladiator", "Titanic", "The Matrix", "Spider-Man No Way Home", "Qasoskorlar", "Sevgi Yulduzi",
+    "Oxirgi Sir", "Temir Odam", "Joker", "Avatar"
+]
+GENRES = ["Drama", "Komediya", "Jangari", "Fantastika", "Triller", "Qo'rqinchli", "Multfilm", "Detektiv"]
+
+# Xato yozilgan, qisman va janr so'rovlari aralashmasi
+QUERIES = [
+    "avengers", "avngers", "dark knight", "interstelar", "qasos", "sevgi yulduz",
+    "matrix", "titanik", "komediya", "oxirgi sir", "spider", "temir odam",
+    "Аватар", "Қасоскорлар", "Интерстеллар"
+]
+
+
+def make_rows(count: int):
+    rnd = random.Random(42)
+    vocabulary = [
+        "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+        for _ in range(20_000)
+    ]
+    for i in range(count):
+        if i % 500 == 0:
+            title = f"{rnd.choice(FAMOUS)} {rnd.randint(1, 3)}"
+        else:
+            title = " ".join(rnd.choice(vocabulary) for _ in range(rnd.randint(1, 4))).title()
+        genre = ", ".join(rnd.sample(GENRES, rnd.randint(1, 2)))
+        yield {
+            "code": BENCH_CODE_START + i,
+            "file_id": f"bench_{i}",
+            "title": title,
+            "genre": genre,
+            "year": rnd.randint(1970, 2025),
+            "views_count": int(rnd.paretovariate(1.2)) - 1,
+            **movie_search_fields(title, genre),
+        }
+
+
+async def seed(db: Database, count: int):
+    rows = list(make_rows(count))
+    async with db.engine.begin() as conn:
+        for i in range(0, len(rows), 5000):
+            await conn.execute(insert(Movie), rows[i:i + 5000])
+        await conn.execute(text("ANALYZE movies"))
+
+
+async def measure(conn, stmt_for, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            started = time.perf_counter()
+            await conn.execute(stmt_for(query))
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "mean": statistics.fmean(timings),
+    }
+
+
+def legacy_stmt(query: str):
+    """Avvalgi so'rov: ILIKE + views_count bo'yicha saralash"""
+    pattern = f"%{query}%"
+    return (
+        select(Movie)
+        .where(Movie.is_active == True, Movie.title.ilike(pattern) | Movie.genre.ilike(pattern))
+        .order_by(Movie.views_count.desc())
+        .limit(10)
+    )
+
+
+def ranked_stmt(query: str):
+    return Database._search_stmt(query, 10)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="search_movies benchmarki")
+    parser.add_argument("--url", default=config.DATABASE_URL)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="benchmark kinolarini o'chirmaslik")
+    args = parser.parse_args()
+
+    db = Database(args.url)
+    await db.init_db()
+
+    async with db.session_maker() as session:
+        existing = (await session.execute(
+            select(Movie.id).where(Movie.code >= BENCH_CODE_START).limit(1)
+        )).first()
+    if not existing:
+        started = time.perf_counter()
+        await seed(db, args.rows)
+        print(f"{args.rows} ta kino qo'shildi: {time.perf_counter() - started:.1f} s")
+
+    cases = [
+        ("eski ILIKE, indekssiz", legacy_stmt, False),
+        ("yangi reyting, indekssiz", ranked_stmt, False),
+        ("yangi reyting, pg_trgm GIN", ranked_stmt, True),
+    ]
+    print(f"{'holat':<30} {'p50 ms':>9} {'p95 ms':>9} {'o`rtacha':>9}")
+    try:
+        async with db.engine.connect() as conn:
+            for name, stmt_for, use_index in cases:
+                # Indekssiz holat: rejalashtiruvchi faqat seq scan tanlaydi
+                flag = "on" if use_index else "off"
+                await conn.execute(text(f"SET enable_bitmapscan = {flag}"))
+                await conn.execute(text(f"SET enable_indexscan = {flag}"))
+                await measure(conn, stmt_for, 1)  # qizdirish
+                result = await measure(conn, stmt_for, args.repeats)
+                print(f"{name:<30} {result['p50']:>9.2f} {result['p95']:>9.2f} {result['mean']:>9.2f}")
+
+            compiled = ranked_stmt("avngers").compile(dialect=db.engine.dialect)
+            params = tuple(compiled.params[name] for name in compiled.positiontup)
+            plan = await conn.exec_driver_sql(f"EXPLAIN {compiled}", params)
+            print("\nReja (pg_trgm, 'avngers'):")
+            for (line,) in plan:
+                print(f"  {line}")
+    finally:
+        if not args.keep:
+            async with db.engine.begin() as conn:
+                await conn.execute(delete(Movie).where(Movie.code >= BENCH_CODE_START))
+        await db.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
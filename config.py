@@ -8,29 +8,83 @@ load_dotenv()
 @dataclass
 class Config:
     # Bot
-  import os
+    BOT_TOKEN: str = os.getenv("BOT_TOKEN")
+    ADMIN_ID: int = int(os.getenv("ADMIN_ID", 0))
 
-BOT_TOKEN: str = os.getenv("BOT_TOKEN")
-ADMIN_ID: int = int(os.getenv("ADMIN_ID", 0))
-
-    
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL")
-    
+
     # Channel
     CHANNEL_USERNAME: str = os.getenv("CHANNEL_USERNAME")
     MAX_CHANNELS: int = 5
-    
+    INVITE_LINK_REFRESH_INTERVAL: int = 6 * 3600  # soniya
+
     # Features
     ENABLE_STATISTICS: bool = True
     ENABLE_RATINGS: bool = True
     ENABLE_SEARCH: bool = True
     CACHE_TTL: int = 3600
-    
+
+    # Obuna keshi
+    CACHE_NEGATIVE_TTL: int = 60  # obuna bo'lmaganlar uchun qisqa TTL
+    MEMBERSHIP_CACHE_SIZE: int = 100_000
+    MEMBERSHIP_CHECK_CONCURRENCY: int = 20  # bir vaqtdagi get_chat_member so'rovlari
+    MEMBERSHIP_CHECK_TIMEOUT: float = 3.0  # soniya
+    MEMBERSHIP_FAIL_OPEN: bool = False  # timeout/xatolikda obuna bo'lgan deb hisoblash
+    MEMBERSHIP_VERIFY_TTL: int = 24 * 3600  # lokal "a'zo" holati shu muddatdan keyin qayta tekshiriladi
+
+    # Qidiruv reytingi: o'xshashlik * W1 + ln(ko'rishlar + 1) * W2
+    SEARCH_SIMILARITY_WEIGHT: float = 1.0
+    SEARCH_VIEWS_WEIGHT: float = 0.02
+    SEARCH_SIMILARITY_THRESHOLD: float = 0.5  # pg_trgm.word_similarity_threshold
+
+    # Inline qidiruv indeksi (xotirada)
+    CATALOG_REBUILD_INTERVAL: int = 3600  # soniya
+
+    # Inline rejim
+    INLINE_CACHE_TIME: int = 300  # Telegram tomonidagi kesh (soniya)
+    INLINE_IS_PERSONAL: bool = False  # natijalarda foydalanuvchiga xos ma'lumot yo'q
+    INLINE_RESULT_CACHE_SIZE: int = 2000
+    INLINE_RESULT_CACHE_TTL: int = 60  # normalizatsiya qilingan so'rov natijalari (soniya)
+    INLINE_PAGE_SIZE: int = 20  # bitta javobdagi natijalar (Telegram chegarasi 50)
+
+    # Kino keshi
+    MOVIE_CACHE_SIZE: int = 5000
+    MOVIE_CACHE_TTL: int = 300
+    CAPTION_CACHE_SIZE: int = 5000  # tayyor kino captionlari (kino id bo'yicha)
+    CAPTION_CACHE_TTL: int = 3600
+
+    # Ko'rishlar buferi (write-behind)
+    VIEW_FLUSH_INTERVAL_MS: int = 1000
+    VIEW_FLUSH_ROWS: int = 500
+    VIEW_BUFFER_MAX: int = 50_000  # to'lsa yangi ko'rishlar tashlab yuboriladi
+    VIEW_COUNTER_SHARDS: int = 16  # har bir kino uchun hisoblagich slotlari
+    VIEW_FOLD_INTERVAL: int = 30  # slotlar movies.views_count'ga qo'shiladigan interval (soniya)
+    VIEW_PARTITIONS_AHEAD: int = 2  # oldindan yaratiladigan oylik bo'limlar
+    VIEW_RETENTION_MONTHS: int = 6  # xom ko'rishlar saqlanadigan oylar (0 — cheksiz)
+
+    # Foydalanuvchi faolligi (last_active buferi)
+    LAST_ACTIVE_FLUSH_INTERVAL: int = 5  # soniya
+    LAST_ACTIVE_TOUCH_INTERVAL: int = 300  # shu muddat ichida qayta yozilmaydi (soniya)
+    LAST_ACTIVE_TOUCH_CACHE_SIZE: int = 200_000
+
+    # Aktiv foydalanuvchilar (kunlik HyperLogLog sketchlari)
+    ACTIVITY_HLL_PRECISION: int = 14  # 16 KB/kun, ~0.8% xatolik
+    ACTIVITY_FLUSH_INTERVAL: int = 60  # soniya
+
+    # Top/yangi/top baholangan ro'yxatlar (xotirada, birinchi sahifa keshi bilan)
+    LEADERBOARD_SIZE: int = 30  # xotiradagi qatorlar (sahifadan ko'p — o'chirishlarga zaxira)
+    LEADERBOARD_MIN_RATINGS: int = 3  # top baholanganga kirish uchun kamida baholar (>= 1)
+    LEADERBOARD_RECONCILE_INTERVAL: int = 300  # soniya
+
+    # Admin statistikasi keshi (soniya)
+    ADMIN_STATS_TTL: int = 30
+
     # Limits
     MAX_BROADCAST_RATE: float = 0.03
     MAX_MOVIE_SIZE_MB: int = 2000
-    
+    MOVIES_PAGE_SIZE: int = 10  # ro'yxatlardagi bitta sahifa
+
     # Messages
     WELCOME_MESSAGE: str = "🎬 Xush kelibsiz! Premium kino botiga marhamat!"
 
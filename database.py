@@ -1,11 +1,24 @@
-from typing import Optional, Sequence, List, Tuple
-from datetime import datetime, timedelta
-from sqlalchemy import BigInteger, String, select, delete, func, Integer, Float, DateTime, Text, Index, ForeignKey, update
+import asyncio
+import random
+import re
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional, Sequence, List, Tuple
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta
+from sqlalchemy import BigInteger, String, select, delete, func, Integer, Float, DateTime, Date, Text, Index, ForeignKey, update, text, insert, values, column, exists, LargeBinary, Computed, bindparam, tuple_, cast
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.dialects.postgresql import insert as pg_insert 
+from sqlalchemy.dialects.postgresql import insert as pg_insert, TSVECTOR
 import logging
 
+from config import config
+from cache import TTLCache
+from hll import HyperLogLog
+from translit import normalize
+from search_index import CatalogIndex, encode_cursor, decode_cursor
+from leaderboard import BoardEntry, Leaderboard
+
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
@@ -23,16 +36,55 @@ class User(Base):
     is_premium: Mapped[bool] = mapped_column(default=False)
     joined_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     last_active: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Jami ko'rishlar (xom movie_views eski bo'limlari o'chirilsa ham saqlanadi)
+    views_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     
     # Relationships
     views = relationship("MovieView", back_populates="user", cascade="all, delete-orphan")
     ratings = relationship("MovieRating", back_populates="user", cascade="all, delete-orphan")
 
-class Movie(Base):
+def _average_rating(rating_sum: int, rating_count: int) -> Tuple[float, int]:
+    """(o'rtacha baho, baholar soni)"""
+    if not rating_count:
+        return 0.0, 0
+    return round(rating_sum / rating_count, 1), rating_count
+
+class RatingMixin:
+    """Movie va MovieRecord uchun denormallashtirilgan reyting ustunlaridan hisob"""
+
+    @property
+    def rating(self) -> Tuple[float, int]:
+        return _average_rating(self.rating_sum, self.rating_count)
+
+    @property
+    def rating_histogram(self) -> List[int]:
+        """1..5 baholar soni"""
+        return [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+
+# Nom 'A', janr/davlat/tavsif 'B' og'irlikda
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(search_title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(search_text, '')), 'B')"
+)
+
+def movie_search_fields(title: str, genre: str, description: str = None, country: str = None) -> dict:
+    """movies.search_title / search_text qiymatlari"""
+    return {
+        'search_title': normalize(title),
+        'search_text': " ".join(filter(None, (normalize(genre), normalize(country), normalize(description))))
+    }
+
+class Movie(RatingMixin, Base):
     __tablename__ = "movies"
     __table_args__ = (
         Index('idx_movie_code', 'code'),
         Index('idx_movie_title', 'title'),
+        # pg_trgm: ILIKE '%...%' va o'xshashlik qidiruvi uchun
+        Index('idx_movie_search_title_trgm', 'search_title', postgresql_using='gin', postgresql_ops={'search_title': 'gin_trgm_ops'}),
+        Index('idx_movie_search_vector', 'search_vector', postgresql_using='gin'),
+        # Top/yangi ro'yxatlar uchun keyset sahifalash: (kalit, id) < kursor
+        Index('idx_movie_top', text('views_count DESC'), text('id DESC'), postgresql_where=text('is_active')),
+        Index('idx_movie_new', text('added_at DESC'), text('id DESC'), postgresql_where=text('is_active')),
     )
     
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -51,11 +103,109 @@ class Movie(Base):
     views_count: Mapped[int] = mapped_column(Integer, default=0)
     is_active: Mapped[bool] = mapped_column(default=True)
     added_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Har bir tahrirda oshadi (tayyor caption keshi shu bo'yicha eskiradi)
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+    
+    # Reyting agregatlari (add_rating ichida tranzaksiyada yangilanadi)
+    rating_sum: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    rating_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    rating_1: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    rating_2: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    rating_3: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    rating_4: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    rating_5: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    
+    # Qidiruv: translit.normalize qilingan matnlar (yozuvdan qat'i nazar topish uchun)
+    search_title: Mapped[Optional[str]] = mapped_column(Text, deferred=True)
+    search_text: Mapped[Optional[str]] = mapped_column(Text, deferred=True)
+    search_vector = mapped_column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True), deferred=True)
     
     # Relationships
     views = relationship("MovieView", back_populates="movie", cascade="all, delete-orphan")
     ratings = relationship("MovieRating", back_populates="movie", cascade="all, delete-orphan")
 
+# CatalogIndex uchun kerakli ustunlar
+CATALOG_COLUMNS = (
+    Movie.id, Movie.code, Movie.title, Movie.genre, Movie.country, Movie.quality,
+    Movie.views_count, Movie.rating_sum, Movie.rating_count, Movie.is_active
+)
+
+# Leaderboard (BoardEntry) uchun — katalog ustunlari va qo'shilgan sana
+LEADERBOARD_COLUMNS = CATALOG_COLUMNS + (Movie.added_at,)
+
+# Top baholangan: o'rtacha baho, so'ng baholar soni bo'yicha
+RATING_AVERAGE = cast(Movie.rating_sum, Float) / Movie.rating_count
+
+@dataclass(frozen=True)
+class MovieRecord(RatingMixin):
+    """Keshlanadigan, o'zgarmas kino yozuvi (Movie bilan bir xil maydonlar)"""
+    id: int
+    code: int
+    file_id: str
+    title: str
+    genre: str
+    description: Optional[str]
+    year: Optional[int]
+    country: Optional[str]
+    duration: Optional[int]
+    language: str
+    quality: str
+    imdb_rating: Optional[float]
+    thumbnail_file_id: Optional[str]
+    views_count: int
+    is_active: bool
+    added_at: datetime
+    version: int
+    rating_sum: int
+    rating_count: int
+    rating_1: int
+    rating_2: int
+    rating_3: int
+    rating_4: int
+    rating_5: int
+
+    @classmethod
+    def from_orm(cls, movie: Movie) -> "MovieRecord":
+        return cls(**{f.name: getattr(movie, f.name) for f in fields(cls)})
+
+    @classmethod
+    def from_row(cls, row) -> "MovieRecord":
+        """movies ustunlarini o'z ichiga olgan Core natija qatoridan"""
+        return cls(**{f.name: row._mapping[f.name] for f in fields(cls)})
+
+class Genre(Base):
+    """Janrlar ma'lumotnomasi (movies.genre matnidan ajratiladi)"""
+    __tablename__ = "genres"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String)
+    slug: Mapped[str] = mapped_column(String, unique=True)  # translit.normalize(name)
+
+class MovieGenre(Base):
+    """Kino <-> janr bog'lanishi; faqat faol kinolar uchun saqlanadi"""
+    __tablename__ = "movie_genres"
+    __table_args__ = (
+        # Janr bo'yicha ko'rish faqat shu indeksdan o'qiladi (keyset, index-only scan)
+        Index('idx_movie_genres_cursor', 'genre_id', text('views_count DESC'), text('movie_id DESC')),
+        # Kino bo'yicha: fold_view_counters, janrlarni qayta yozish va ON DELETE CASCADE
+        Index('idx_movie_genres_movie', 'movie_id'),
+    )
+    genre_id: Mapped[int] = mapped_column(Integer, ForeignKey('genres.id', ondelete='CASCADE'), primary_key=True)
+    movie_id: Mapped[int] = mapped_column(Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True)
+    # movies.views_count nusxasi (fold_view_counters bilan yangilanadi)
+    views_count: Mapped[int] = mapped_column(Integer, default=0)
+
+_GENRE_SEPARATORS_RE = re.compile(r"[,/|;]+")
+
+def split_genres(genre: str) -> Dict[str, str]:
+    """'Drama, Komediya' -> {slug: nom}; bir xil janrning turli yozilishlari birlashadi"""
+    genres = {}
+    for name in _GENRE_SEPARATORS_RE.split(genre or ""):
+        name = name.strip()
+        slug = normalize(name)
+        if slug and slug not in genres:
+            genres[slug] = name
+    return genres
+
 class RequiredChannel(Base):
     __tablename__ = "required_channels"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -63,23 +213,66 @@ class RequiredChannel(Base):
     title: Mapped[str] = mapped_column(String)
     priority: Mapped[int] = mapped_column(Integer, default=0)
     is_active: Mapped[bool] = mapped_column(default=True)
+    invite_link: Mapped[Optional[str]] = mapped_column(String)
+
+class ChannelMember(Base):
+    """Majburiy kanallar a'zoligi (chat_member yangilanishlaridan)"""
+    __tablename__ = "channel_members"
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    is_member: Mapped[bool] = mapped_column(default=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class MovieView(Base):
+    """Xom ko'rishlar — viewed_at bo'yicha oylik bo'limlarga ajratilgan"""
     __tablename__ = "movie_views"
     __table_args__ = (
-        Index('idx_views_user_movie', 'user_id', 'movie_id'),
+        Index('idx_views_user_movie', 'user_id', 'movie_id', 'viewed_at'),
         Index('idx_views_date', 'viewed_at'),
+        {'postgresql_partition_by': 'RANGE (viewed_at)'},
     )
     
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # Bo'limlangan jadvalda PK bo'lim kalitini o'z ichiga olishi shart
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'))
     movie_id: Mapped[int] = mapped_column(Integer, ForeignKey('movies.id', ondelete='CASCADE'))
-    viewed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    viewed_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="views")
     movie = relationship("Movie", back_populates="views")
 
+class MovieViewDaily(Base):
+    """Kunlik ko'rishlar yig'indisi (ko'rishlar buferi bilan birga yangilanadi)"""
+    __tablename__ = "movie_view_daily"
+    movie_id: Mapped[int] = mapped_column(Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    views: Mapped[int] = mapped_column(BigInteger, default=0)
+    unique_viewers: Mapped[int] = mapped_column(Integer, default=0)
+
+class MovieViewCounter(Base):
+    """
+    Ko'rishlar hisoblagichining slotlari. Yozuvchilar tasodifiy slotni oshiradi,
+    shuning uchun mashhur kinoning bitta movies qatori uchun navbat hosil bo'lmaydi.
+    Yig'indi vaqti-vaqti bilan movies.views_count'ga qo'shiladi.
+    """
+    __tablename__ = "movie_view_counters"
+    movie_id: Mapped[int] = mapped_column(Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    views: Mapped[int] = mapped_column(BigInteger, default=0)
+
+class DailyActiveSketch(Base):
+    """Kunlik aktiv foydalanuvchilar HyperLogLog sketchi (birlashtiriladigan)"""
+    __tablename__ = "daily_active_sketches"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    registers: Mapped[bytes] = mapped_column(LargeBinary)
+
+class GlobalCounter(Base):
+    """Umumiy statistika hisoblagichlari (users, movies, views)"""
+    __tablename__ = "global_counters"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+
 class MovieRating(Base):
     __tablename__ = "movie_ratings"
     __table_args__ = (
@@ -98,43 +291,672 @@ class MovieRating(Base):
     movie = relationship("Movie", back_populates="ratings")
 
 
+_SEARCH_SOURCE_FIELDS = {'title', 'genre', 'description', 'country'}
+
+async def _ensure_genres(executor, genres: Dict[str, str]) -> Dict[str, int]:
+    """Yo'q janrlarni yaratish; {slug: id} qaytaradi"""
+    await executor.execute(
+        pg_insert(Genre)
+        .values([{'name': name, 'slug': slug} for slug, name in genres.items()])
+        .on_conflict_do_nothing(index_elements=[Genre.slug])
+    )
+    result = await executor.execute(select(Genre.slug, Genre.id).where(Genre.slug.in_(list(genres))))
+    return dict(result.all())
+
+def _create_missing_indexes(sync_conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+async def _add_column_if_missing(conn, table: str, column: str, ddl: str) -> bool:
+    """Mavjud jadvalga ustun qo'shish. Ustun yangi qo'shilgan bo'lsa True qaytaradi"""
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ),
+        {'table': table, 'column': column}
+    )
+    if result.first():
+        return False
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    logger.info(f"Migratsiya: {table}.{column} ustuni qo'shildi")
+    return True
+
+
+# Hisoblagich nomi -> boshlang'ich qiymatni hisoblovchi so'rov
+_GLOBAL_COUNTERS = {
+    'users': "SELECT COUNT(*) FROM users",
+    'movies': "SELECT COUNT(*) FROM movies WHERE is_active",
+    'views': "SELECT COALESCE(SUM(views), 0) FROM movie_view_daily",
+}
+
+def _bump_counter(name: str, delta: int):
+    """Hisoblagichni oshirish so'rovi (chaqiruvchi tranzaksiyasi ichida bajariladi)"""
+    return (
+        update(GlobalCounter)
+        .where(GlobalCounter.name == name)
+        .values(value=GlobalCounter.value + delta)
+    )
+
+_VIEW_PARTITION_RE = re.compile(r"^movie_views_y(\d{4})m(\d{2})$")
+
+# Ko'p qatorli users upsert'ida har qator uchun barcha ustunlar parametr bo'ladi
+# (standart qiymatlar ham), shuning uchun partiya 32767 parametr chegarasidan hisoblanadi
+_USER_UPSERT_CHUNK = 32767 // len(User.__table__.c)
+
+# Eski movie_views jadvalini ko'chirishda bitta tranzaksiyadagi qatorlar
+_LEGACY_IMPORT_BATCH = 50_000
+
+def _month_start(day: date, shift: int = 0) -> date:
+    """Oy boshini qaytaradi, shift — oylar bo'yicha siljish"""
+    month_index = day.year * 12 + day.month - 1 + shift
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+class ViewBuffer:
+    """
+    Ko'rishlar uchun write-behind bufer.
+    Ko'rishlar xotirada yig'iladi va har VIEW_FLUSH_INTERVAL_MS yoki VIEW_FLUSH_ROWS
+    qatorda bitta ko'p qatorli INSERT bilan yoziladi, hisoblagichlar esa
+    movie_view_counters slotlariga qo'shiladi.
+    """
+
+    # PostgreSQL parametrlar chegarasi (32767) ichida qolish uchun
+    INSERT_CHUNK = 5000
+
+    def __init__(
+        self,
+        session_maker,
+        flush_interval: float,
+        flush_rows: int,
+        max_rows: int,
+        counter_shards: int,
+        before_write: Optional[Callable[[], Awaitable]] = None,
+        is_deferred: Optional[Callable[[int], bool]] = None
+    ):
+        self._session_maker = session_maker
+        self._before_write = before_write
+        # before_write xato bersa: shu foydalanuvchilar ko'rishlari keyingi flush'ga qoldiriladi
+        self._is_deferred = is_deferred
+        self.counter_shards = counter_shards
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self._rows: List[Tuple[int, int, datetime]] = []
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        
+        # Ko'rsatkichlar
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.last_flush_size = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    def add(self, user_id: int, movie_id: int):
+        if len(self._rows) >= self.max_rows:
+            self.dropped_rows += 1
+            return
+        self._rows.append((user_id, movie_id, datetime.utcnow()))
+        if len(self._rows) >= self.flush_rows:
+            self._full.set()
+
+    async def flush(self) -> int:
+        """Buferdagi ko'rishlarni bazaga yozish. Yozilgan qatorlar sonini qaytaradi"""
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            self._full.clear()
+            if not rows:
+                return 0
+            
+            deferred = []
+            if self._before_write:
+                try:
+                    await self._before_write()
+                except Exception as e:
+                    # Qolgan ko'rishlar yoziladi, yozilmagan foydalanuvchilarniki kutadi
+                    logger.error(f"Ko'rishlardan oldingi yozuvda xatolik: {e}")
+                    if self._is_deferred:
+                        deferred = [row for row in rows if self._is_deferred(row[0])]
+                        rows = [row for row in rows if not self._is_deferred(row[0])]
+            
+            try:
+                if rows:
+                    await self._write(rows)
+            except Exception:
+                self._requeue(deferred + rows)
+                raise
+            self._requeue(deferred)
+            if not rows:
+                return 0
+            
+            lag = (datetime.utcnow() - rows[0][2]).total_seconds()
+            self.flush_count += 1
+            self.flushed_rows += len(rows)
+            self.last_flush_size = len(rows)
+            self.last_flush_lag = lag
+            self.max_flush_lag = max(self.max_flush_lag, lag)
+            return len(rows)
+
+    def _requeue(self, rows: List[Tuple[int, int, datetime]]):
+        """Keyingi urinish uchun qaytarib qo'yish (bufer chegarasigacha)"""
+        room = max(0, self.max_rows - len(self._rows))
+        self.dropped_rows += max(0, len(rows) - room)
+        self._rows[:0] = rows[:room]
+
+    async def _write(self, rows: List[Tuple[int, int, datetime]]):
+        inserted = Counter()
+        viewers = Counter()
+        async with self._session_maker() as session:
+            # Kunlik yig'indi xom qatorlardan oldin yoziladi: yangi tomoshabinlar
+            # shu kunda movie_views'da hali yo'qligi bo'yicha aniqlanadi
+            daily_rows = Counter(
+                (user_id, movie_id, viewed_at.date()) for user_id, movie_id, viewed_at in rows
+            )
+            daily_items = [key + (views,) for key, views in daily_rows.items()]
+            for i in range(0, len(daily_items), self.INSERT_CHUNK):
+                await session.execute(self._daily_rollup_stmt(daily_items[i:i + self.INSERT_CHUNK]))
+            
+            for i in range(0, len(rows), self.INSERT_CHUNK):
+                batch = values(
+                    column("user_id", BigInteger),
+                    column("movie_id", Integer),
+                    column("viewed_at", DateTime),
+                    name="batch"
+                ).data(rows[i:i + self.INSERT_CHUNK])
+                # O'chirilgan kino/foydalanuvchi butun partiyani FK xatosiga olib kelmasligi uchun
+                result = await session.execute(
+                    insert(MovieView).from_select(
+                        ["user_id", "movie_id", "viewed_at"],
+                        select(batch.c.user_id, batch.c.movie_id, batch.c.viewed_at)
+                        .join(Movie, Movie.id == batch.c.movie_id)
+                        .join(User, User.id == batch.c.user_id)
+                    )
+                    .returning(MovieView.movie_id, MovieView.user_id)
+                )
+                for movie_id, user_id in result.all():
+                    inserted[movie_id] += 1
+                    viewers[user_id] += 1
+            
+            if not inserted:
+                await session.commit()
+                return
+            
+            # Foydalanuvchilar ko'rishlari (id tartibida — parallel upsert bilan deadlock bo'lmasligi uchun)
+            viewer_items = sorted(viewers.items())
+            for i in range(0, len(viewer_items), self.INSERT_CHUNK):
+                batch = values(
+                    column("user_id", BigInteger),
+                    column("views", Integer),
+                    name="viewers"
+                ).data(viewer_items[i:i + self.INSERT_CHUNK])
+                await session.execute(
+                    update(User)
+                    .where(User.id == batch.c.user_id)
+                    .values(views_count=User.views_count + batch.c.views)
+                    .execution_options(synchronize_session=False)
+                )
+            
+            # Hisoblagich slotlariga yozish — movies qatorlari bloklanmaydi
+            counter_items = sorted(inserted.items())
+            for i in range(0, len(counter_items), self.INSERT_CHUNK):
+                stmt = pg_insert(MovieViewCounter).values([
+                    {
+                        'movie_id': movie_id,
+                        'shard': random.randrange(self.counter_shards),
+                        'views': views
+                    }
+                    for movie_id, views in counter_items[i:i + self.INSERT_CHUNK]
+                ])
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[MovieViewCounter.movie_id, MovieViewCounter.shard],
+                        set_={'views': MovieViewCounter.views + stmt.excluded.views}
+                    )
+                )
+            await session.execute(_bump_counter('views', sum(inserted.values())))
+            await session.commit()
+
+    @staticmethod
+    def _daily_rollup_stmt(items: List[Tuple[int, int, date, int]]):
+        daily = values(
+            column("user_id", BigInteger),
+            column("movie_id", Integer),
+            column("day", Date),
+            column("views", Integer),
+            name="daily"
+        ).data(items)
+        seen_before = exists().where(
+            MovieView.user_id == daily.c.user_id,
+            MovieView.movie_id == daily.c.movie_id,
+            MovieView.viewed_at >= daily.c.day,
+            MovieView.viewed_at < daily.c.day + timedelta(days=1)
+        )
+        stmt = pg_insert(MovieViewDaily).from_select(
+            ["movie_id", "day", "views", "unique_viewers"],
+            select(
+                daily.c.movie_id,
+                daily.c.day,
+                func.sum(daily.c.views),
+                func.count().filter(~seen_before)
+            )
+            .select_from(daily)
+            .join(Movie, Movie.id == daily.c.movie_id)
+            .join(User, User.id == daily.c.user_id)
+            .group_by(daily.c.movie_id, daily.c.day)
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[MovieViewDaily.movie_id, MovieViewDaily.day],
+            set_={
+                'views': MovieViewDaily.views + stmt.excluded.views,
+                'unique_viewers': MovieViewDaily.unique_viewers + stmt.excluded.unique_viewers
+            }
+        )
+
+    async def run(self):
+        """Fon vazifasi: bufer to'lganda yoki interval o'tganda yozish"""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            
+            try:
+                # shield: to'xtatishda (cancel) boshlangan partiya yozib tugatiladi,
+                # close() dagi flush esa lock orqali uni kutadi
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"Ko'rishlarni yozishda xatolik: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._rows),
+            'flushes': self.flush_count,
+            'flushed_rows': self.flushed_rows,
+            'dropped_rows': self.dropped_rows,
+            'last_flush_size': self.last_flush_size,
+            'last_flush_lag': round(self.last_flush_lag, 3),
+            'max_flush_lag': round(self.max_flush_lag, 3)
+        }
+
+
 class Database:
     def __init__(self, db_url: str):
         self.engine = create_async_engine(
             db_url, 
             pool_recycle=3600,
             pool_pre_ping=True,
-            echo=False
+            echo=False,
+            connect_args={
+                # title %> query operatori uchun chegara (standart 0.6 bitta xatoni ham o'tkazmaydi)
+                "server_settings": {
+                    "pg_trgm.word_similarity_threshold": str(config.SEARCH_SIMILARITY_THRESHOLD)
+                }
+            }
         )
         self.session_maker = async_sessionmaker(
             self.engine, 
             expire_on_commit=False,
             class_=AsyncSession
         )
+        
+        # Majburiy kanallar snapshot'i: (versiya, kanallar).
+        # Kanal qo'shilganda/o'chirilganda versiya oshadi va snapshot qayta o'qiladi
+        self._channels_version = 0
+        self._channels_snapshot: Optional[Tuple[int, Tuple[RequiredChannel, ...]]] = None
+        
+        # Kino keshi: id -> MovieRecord, kod esa faqat id'ga ishora qiladi (ikkalasi ham bir xil chegarali)
+        self._movie_cache = TTLCache(maxsize=config.MOVIE_CACHE_SIZE, ttl=config.MOVIE_CACHE_TTL)
+        self._movie_ids_by_code = TTLCache(maxsize=config.MOVIE_CACHE_SIZE, ttl=config.MOVIE_CACHE_TTL)
+        
+        # Inline qidiruv uchun xotiradagi indeks (rebuild_catalog bilan yuklanadi)
+        self.catalog = self._new_catalog()
+        # Qayta qurish davomidagi o'zgarishlar (yangi indeksga qayta qo'llanadi); None — qurish yo'q
+        self._catalog_changes: Optional[List[Callable[[CatalogIndex], None]]] = None
+        self._catalog_rebuild_lock = asyncio.Lock()
+        
+        # Top/yangi/top baholangan ro'yxatlarning birinchi sahifalari (xotirada)
+        self.leaderboards = self._new_leaderboards()
+        self._leaderboard_lock = asyncio.Lock()
+        
+        # Hali yozilmagan faollik: user_id -> (username, first_name, last_active)
+        self._pending_users: Dict[int, Tuple[str, str, datetime]] = {}
+        self._touched_users = TTLCache(
+            maxsize=config.LAST_ACTIVE_TOUCH_CACHE_SIZE,
+            ttl=config.LAST_ACTIVE_TOUCH_INTERVAL
+        )
+        self._users_lock = asyncio.Lock()
+        
+        # Hali bazaga yozilmagan kunlik aktivlik sketchlari
+        self._activity_sketches: Dict[date, HyperLogLog] = {}
+        self._activity_lock = asyncio.Lock()
+        
+        # Admin statistikasi snapshot'i: (monotonic vaqt, natija)
+        self._admin_stats: Optional[Tuple[float, dict]] = None
+        
+        self.view_buffer = ViewBuffer(
+            self.session_maker,
+            flush_interval=config.VIEW_FLUSH_INTERVAL_MS / 1000,
+            flush_rows=config.VIEW_FLUSH_ROWS,
+            max_rows=config.VIEW_BUFFER_MAX,
+            counter_shards=config.VIEW_COUNTER_SHARDS,
+            # Yangi foydalanuvchilar ko'rishlardan oldin users'ga yozilishi kerak (FK)
+            before_write=self.flush_user_activity,
+            is_deferred=lambda user_id: user_id in self._pending_users
+        )
 
     async def init_db(self):
         async with self.engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await self._detach_legacy_views(conn)
             await conn.run_sync(Base.metadata.create_all)
+            await self.ensure_view_partitions(conn)
+        # Katta jadval bitta tranzaksiyada emas, qismlab ko'chiriladi (uzilsa keyingi ishga tushishda davom etadi)
+        await self._import_legacy_views()
+        async with self.engine.begin() as conn:
+            await self._migrate(conn)
         logger.info("Database initialized successfully")
 
+    # --- movie_views bo'limlari ---
+    async def _detach_legacy_views(self, conn) -> bool:
+        """
+        Oddiy (bo'limlanmagan) movie_views jadvalini movie_views_legacy deb qayta nomlash,
+        create_all uning o'rniga bo'limlangan jadval yaratishi uchun
+        """
+        result = await conn.execute(text(
+            "SELECT relkind::text FROM pg_class "
+            "WHERE relname = 'movie_views' AND relnamespace = 'public'::regnamespace"
+        ))
+        if result.scalar() != 'r':
+            return False
+        
+        for stmt in (
+            "ALTER TABLE movie_views RENAME TO movie_views_legacy",
+            "ALTER TABLE movie_views_legacy RENAME CONSTRAINT movie_views_pkey TO movie_views_legacy_pkey",
+            "ALTER SEQUENCE IF EXISTS movie_views_id_seq RENAME TO movie_views_legacy_id_seq",
+            "DROP INDEX IF EXISTS idx_views_user_movie",
+            "DROP INDEX IF EXISTS idx_views_date",
+        ):
+            await conn.execute(text(stmt))
+        logger.info("Migratsiya: movie_views bo'limlangan jadvalga o'tkazilmoqda")
+        return True
+
+    async def _import_legacy_views(self):
+        """
+        Eski ko'rishlarni bo'limlarga ko'chirish va kunlik yig'indini hisoblash.
+        Har bir partiya alohida tranzaksiyada ko'chiriladi (DELETE ... RETURNING),
+        kunlik yig'indi esa oyma-oy. Bot hali so'rovlarga javob bermayotganda ishlaydi.
+        """
+        async with self.engine.begin() as conn:
+            if (await conn.execute(text("SELECT to_regclass('movie_views_legacy')"))).scalar() is None:
+                return
+            oldest = (await conn.execute(text("SELECT MIN(viewed_at) FROM movie_views_legacy"))).scalar()
+            if oldest:
+                await self.ensure_view_partitions(conn, since=oldest.date())
+        
+        moved = 0
+        while True:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(text(
+                    "WITH batch AS ("
+                    "  DELETE FROM movie_views_legacy WHERE id IN ("
+                    "    SELECT id FROM movie_views_legacy ORDER BY id LIMIT :limit"
+                    "  ) RETURNING id, user_id, movie_id, viewed_at"
+                    ") "
+                    "INSERT INTO movie_views (id, user_id, movie_id, viewed_at) "
+                    "SELECT id, user_id, movie_id, COALESCE(viewed_at, now() AT TIME ZONE 'utc') FROM batch"
+                ), {'limit': _LEGACY_IMPORT_BATCH})
+            if not result.rowcount:
+                break
+            moved += result.rowcount
+            logger.info(f"Migratsiya: {moved} ta ko'rish ko'chirildi")
+        
+        async with self.engine.begin() as conn:
+            await conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('movie_views', 'id'), "
+                "COALESCE((SELECT MAX(id) FROM movie_views), 0) + 1, false)"
+            ))
+            bounds = (await conn.execute(text("SELECT MIN(viewed_at), MAX(viewed_at) FROM movie_views"))).first()
+        
+        if bounds[0] is not None:
+            month, last = _month_start(bounds[0].date()), _month_start(bounds[1].date())
+            while month <= last:
+                next_month = _month_start(month, 1)
+                async with self.engine.begin() as conn:
+                    await conn.execute(text(
+                        "INSERT INTO movie_view_daily (movie_id, day, views, unique_viewers) "
+                        "SELECT movie_id, viewed_at::date, COUNT(*), COUNT(DISTINCT user_id) "
+                        "FROM movie_views WHERE viewed_at >= :start AND viewed_at < :end "
+                        "GROUP BY movie_id, viewed_at::date "
+                        "ON CONFLICT (movie_id, day) DO UPDATE "
+                        "SET views = EXCLUDED.views, unique_viewers = EXCLUDED.unique_viewers"
+                    ), {'start': month, 'end': next_month})
+                month = next_month
+        
+        async with self.engine.begin() as conn:
+            await conn.execute(text("DROP TABLE movie_views_legacy"))
+        logger.info("Migratsiya: movie_views bo'limlarga ko'chirildi")
+
+    async def ensure_view_partitions(self, conn, since: date = None):
+        """Joriy oydan VIEW_PARTITIONS_AHEAD oy oldinga (yoki since'dan) oylik bo'limlar"""
+        today = datetime.utcnow().date()
+        month = _month_start(since or today)
+        last = _month_start(today, config.VIEW_PARTITIONS_AHEAD)
+        
+        while month <= last:
+            next_month = _month_start(month, 1)
+            name = f"movie_views_y{month.year}m{month.month:02d}"
+            if (await conn.execute(text("SELECT to_regclass(:name)"), {'name': name})).scalar() is None:
+                await self._create_view_partition(conn, name, month, next_month)
+            month = next_month
+        
+        # Zaxira bo'lim: oylik bo'lim yaratilmay qolsa ham yozish to'xtamaydi
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS movie_views_default PARTITION OF movie_views DEFAULT"
+        ))
+
+    async def _create_view_partition(self, conn, name: str, month: date, next_month: date):
+        """
+        Oylik bo'lim yaratish. DEFAULT bo'limda shu oy qatorlari bo'lsa, PostgreSQL
+        bo'limni yaratishga ruxsat bermaydi — DEFAULT ajratiladi, qatorlar yangi
+        bo'limga ko'chiriladi va DEFAULT qayta ulanadi (bitta tranzaksiyada).
+        """
+        bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        in_month = "viewed_at >= :start AND viewed_at < :end"
+        params = {'start': month, 'end': next_month}
+        
+        has_default = (await conn.execute(text("SELECT to_regclass('movie_views_default')"))).scalar()
+        stranded = has_default is not None and (await conn.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM movie_views_default WHERE {in_month})"), params
+        )).scalar()
+        if not stranded:
+            await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF movie_views {bounds}"))
+            return
+        
+        await conn.execute(text("ALTER TABLE movie_views DETACH PARTITION movie_views_default"))
+        await conn.execute(text(f"CREATE TABLE {name} PARTITION OF movie_views {bounds}"))
+        result = await conn.execute(text(
+            f"WITH moved AS (DELETE FROM movie_views_default WHERE {in_month} RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), params)
+        await conn.execute(text("ALTER TABLE movie_views ATTACH PARTITION movie_views_default DEFAULT"))
+        logger.info(f"{name} bo'limi yaratildi, DEFAULT bo'limdan {result.rowcount} ta qator ko'chirildi")
+
+    async def drop_old_view_partitions(self, conn) -> List[str]:
+        """VIEW_RETENTION_MONTHS'dan eski xom bo'limlarni o'chirish (kunlik yig'indi qoladi)"""
+        if config.VIEW_RETENTION_MONTHS <= 0:
+            return []
+        
+        cutoff = _month_start(datetime.utcnow().date(), -config.VIEW_RETENTION_MONTHS)
+        result = await conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'movie_views'"
+        ))
+        
+        dropped = []
+        for name in result.scalars().all():
+            match = _VIEW_PARTITION_RE.match(name)
+            if not match:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if _month_start(month, 1) <= cutoff:
+                await conn.execute(text(f"ALTER TABLE movie_views DETACH PARTITION {name}"))
+                await conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        
+        if dropped:
+            logger.info(f"Eski ko'rish bo'limlari o'chirildi: {', '.join(dropped)}")
+        return dropped
+
+    async def run_view_maintenance(self):
+        """Fon vazifasi: kelgusi oylar bo'limlarini yaratish va eskilarini o'chirish"""
+        while True:
+            try:
+                async with self.engine.begin() as conn:
+                    await self.ensure_view_partitions(conn)
+                    await self.drop_old_view_partitions(conn)
+            except Exception as e:
+                logger.error(f"Ko'rish bo'limlarini yuritishda xatolik: {e}")
+            await asyncio.sleep(24 * 3600)
+
+    async def close(self):
+        """Buferlarni yozib, ulanishlarni yopish"""
+        # Ko'rishlar birinchi (yangi foydalanuvchilar before_write bilan yoziladi);
+        # biri xato bersa ham qolganlari yoziladi
+        for flush in (
+            self.view_buffer.flush,
+            self.flush_user_activity,
+            self.fold_view_counters,
+            self.flush_activity_sketches
+        ):
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"Yopishda buferni yozishda xatolik ({flush.__name__}): {e}")
+        await self.engine.dispose()
+
+    async def _migrate(self, conn):
+        """create_all mavjud jadvallarga qo'shilgan ustunlarni yaratmaydi"""
+        await _add_column_if_missing(conn, "required_channels", "invite_link", "VARCHAR")
+        await _add_column_if_missing(conn, "movies", "version", "INTEGER NOT NULL DEFAULT 1")
+        if await _add_column_if_missing(conn, "users", "views_count", "INTEGER NOT NULL DEFAULT 0"):
+            await conn.execute(text(
+                "UPDATE users SET views_count = v.views "
+                "FROM (SELECT user_id, COUNT(*) AS views FROM movie_views GROUP BY user_id) AS v "
+                "WHERE users.id = v.user_id"
+            ))
+        
+        rating_columns = ["rating_sum", "rating_count"] + [f"rating_{i}" for i in range(1, 6)]
+        added = [
+            await _add_column_if_missing(conn, "movies", column, "INTEGER NOT NULL DEFAULT 0")
+            for column in rating_columns
+        ]
+        if any(added):
+            # Mavjud baholardan agregatlarni bir marta hisoblash
+            await conn.execute(text(
+                "UPDATE movies SET "
+                "rating_sum = agg.rating_sum, rating_count = agg.rating_count, "
+                "rating_1 = agg.r1, rating_2 = agg.r2, rating_3 = agg.r3, "
+                "rating_4 = agg.r4, rating_5 = agg.r5 "
+                "FROM ("
+                "  SELECT movie_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count, "
+                "  COUNT(*) FILTER (WHERE rating = 1) AS r1, COUNT(*) FILTER (WHERE rating = 2) AS r2, "
+                "  COUNT(*) FILTER (WHERE rating = 3) AS r3, COUNT(*) FILTER (WHERE rating = 4) AS r4, "
+                "  COUNT(*) FILTER (WHERE rating = 5) AS r5 "
+                "  FROM movie_ratings GROUP BY movie_id"
+                ") AS agg WHERE movies.id = agg.movie_id"
+            ))
+            logger.info("Migratsiya: reyting agregatlari hisoblandi")
+        
+        # Qidiruv ustunlari: normalize Python'da, shuning uchun to'ldirish ham shu yerda
+        await _add_column_if_missing(conn, "movies", "search_title", "TEXT")
+        await _add_column_if_missing(conn, "movies", "search_text", "TEXT")
+        await _add_column_if_missing(
+            conn, "movies", "search_vector", f"TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+        )
+        await self._backfill_search_fields(conn)
+        
+        # Janr bo'yicha ko'rish movie_genres'dan — bo'sh bo'lsa movies.genre'dan bir marta to'ldiriladi
+        has_genres = (await conn.execute(select(Genre.id).limit(1))).first()
+        if not has_genres:
+            await self._backfill_genres(conn)
+        
+        # Kunlik sketchlar bo'sh bo'lsa, users.last_active'dan boshlang'ich holat
+        has_sketches = (await conn.execute(select(DailyActiveSketch.day).limit(1))).first()
+        if not has_sketches:
+            await self._seed_activity_sketches(conn)
+        
+        # Yo'q hisoblagichlarni bir marta haqiqiy qiymat bilan to'ldirish
+        existing = set((await conn.execute(select(GlobalCounter.name))).scalars().all())
+        for name, query in _GLOBAL_COUNTERS.items():
+            if name not in existing:
+                value = (await conn.execute(text(query))).scalar()
+                await conn.execute(insert(GlobalCounter).values(name=name, value=value))
+                logger.info(f"Migratsiya: '{name}' hisoblagichi = {value}")
+        
+        # create_all mavjud jadvallarga yangi indekslarni qo'shmaydi
+        await conn.run_sync(_create_missing_indexes)
+
     # --- User Methods ---
-    async def add_user(self, user_id: int, username: str, first_name: str = None):
-        async with self.session_maker() as session:
-            stmt = (
-                pg_insert(User)
-                .values(
-                    id=user_id, 
-                    username=username,
-                    first_name=first_name,
-                    last_active=datetime.utcnow()
-                )
-                .on_conflict_do_update(
-                    index_elements=[User.id],
-                    set_={'last_active': datetime.utcnow(), 'username': username}
-                )
-            )
-            await session.execute(stmt)
-            await session.commit()
+    def touch_user(self, user_id: int, username: str, first_name: str):
+        """Faollikni xotirada qayd qilish; bazaga run_user_activity_flush yozadi"""
+        self.record_activity(user_id)
+        if user_id not in self._pending_users and self._touched_users.get(user_id):
+            return
+        self._pending_users[user_id] = (username, first_name, datetime.utcnow())
+
+    async def flush_user_activity(self) -> int:
+        """Yig'ilgan faollikni bitta ko'p qatorli upsert bilan yozish"""
+        async with self._users_lock:
+            pending, self._pending_users = self._pending_users, {}
+            if not pending:
+                return 0
+            
+            rows = [
+                {'id': user_id, 'username': username, 'first_name': first_name, 'last_active': last_active}
+                for user_id, (username, first_name, last_active) in sorted(pending.items())
+            ]
+            try:
+                created = 0
+                async with self.session_maker() as session:
+                    for i in range(0, len(rows), _USER_UPSERT_CHUNK):
+                        stmt = pg_insert(User).values(rows[i:i + _USER_UPSERT_CHUNK])
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[User.id],
+                            set_={
+                                'last_active': stmt.excluded.last_active,
+                                'username': stmt.excluded.username
+                            }
+                        ).returning(text("xmax = 0"))
+                        result = await session.execute(stmt)
+                        created += sum(1 for is_new in result.scalars() if is_new)
+                    if created:
+                        await session.execute(_bump_counter('users', created))
+                    await session.commit()
+            except BaseException:
+                # Keyingi urinishda yozish uchun qaytarib qo'yamiz (bekor qilinganda ham —
+                # upsert takrorlansa zarari yo'q)
+                for user_id, item in pending.items():
+                    self._pending_users.setdefault(user_id, item)
+                raise
+            
+            for user_id in pending:
+                self._touched_users.set(user_id, True)
+            return len(rows)
+
+    async def run_user_activity_flush(self):
+        """Fon vazifasi: faollikni davriy yozish"""
+        while True:
+            await asyncio.sleep(config.LAST_ACTIVE_FLUSH_INTERVAL)
+            try:
+                await asyncio.shield(self.flush_user_activity())
+            except Exception as e:
+                logger.error(f"Faollikni yozishda xatolik: {e}")
 
     async def get_user(self, user_id: int) -> Optional[User]:
         async with self.session_maker() as session:
@@ -151,14 +973,159 @@ class Database:
             result = await session.execute(select(func.count(User.id)))
             return result.scalar_one()
 
-    async def get_active_users_count(self, days: int = 7) -> int:
-        """So'nggi N kun ichida aktiv foydalanuvchilar soni"""
+    # --- Aktivlik (kunlik HyperLogLog sketchlari) ---
+    def record_activity(self, user_id: int):
+        """Foydalanuvchini bugungi aktivlar sketchiga qo'shish (faqat xotirada)"""
+        today = datetime.utcnow().date()
+        sketch = self._activity_sketches.get(today)
+        if sketch is None:
+            sketch = self._activity_sketches[today] = HyperLogLog(config.ACTIVITY_HLL_PRECISION)
+        sketch.add(user_id)
+
+    async def flush_activity_sketches(self):
+        """Xotiradagi sketchlarni bazadagilar bilan birlashtirib yozish"""
+        async with self._activity_lock:
+            pending, self._activity_sketches = self._activity_sketches, {}
+            try:
+                async with self.session_maker() as session:
+                    for day, sketch in pending.items():
+                        result = await session.execute(
+                            select(DailyActiveSketch.registers)
+                            .where(DailyActiveSketch.day == day)
+                            .with_for_update()
+                        )
+                        stored = result.scalar_one_or_none()
+                        if stored is not None:
+                            sketch.merge(HyperLogLog(config.ACTIVITY_HLL_PRECISION, stored))
+                        
+                        stmt = pg_insert(DailyActiveSketch).values(day=day, registers=sketch.to_bytes())
+                        await session.execute(stmt.on_conflict_do_update(
+                            index_elements=[DailyActiveSketch.day],
+                            set_={'registers': stmt.excluded.registers}
+                        ))
+                    await session.commit()
+            except BaseException:
+                # Yozilmagan sketchlarni qaytarish (oradagi yangi aktivlik bilan birlashtirib;
+                # registrlar maksimum bilan birlashadi — qayta yozish xavfsiz)
+                for day, sketch in pending.items():
+                    current = self._activity_sketches.get(day)
+                    if current is not None:
+                        sketch.merge(current)
+                    self._activity_sketches[day] = sketch
+                raise
+
+    async def run_activity_flush(self):
+        """Fon vazifasi: aktivlik sketchlarini davriy yozish"""
+        while True:
+            await asyncio.sleep(config.ACTIVITY_FLUSH_INTERVAL)
+            try:
+                await asyncio.shield(self.flush_activity_sketches())
+            except Exception as e:
+                logger.error(f"Aktivlik sketchlarini yozishda xatolik: {e}")
+
+    async def _backfill_search_fields(self, conn):
+        """search_title bo'sh bo'lgan kinolar uchun qidiruv matnlarini hisoblash"""
+        result = await conn.execute(
+            select(Movie.id, Movie.title, Movie.genre, Movie.description, Movie.country)
+            .where(Movie.search_title.is_(None))
+        )
+        rows = [
+            {'b_id': movie_id, **movie_search_fields(title, genre, description, country)}
+            for movie_id, title, genre, description, country in result.all()
+        ]
+        if not rows:
+            return
+        
+        stmt = (
+            update(Movie.__table__)
+            .where(Movie.__table__.c.id == bindparam('b_id'))
+            .values(search_title=bindparam('search_title'), search_text=bindparam('search_text'))
+        )
+        for i in range(0, len(rows), ViewBuffer.INSERT_CHUNK):
+            await conn.execute(stmt, rows[i:i + ViewBuffer.INSERT_CHUNK])
+        logger.info(f"Migratsiya: {len(rows)} ta kino uchun qidiruv matni hisoblandi")
+
+    async def _backfill_genres(self, conn):
+        """Mavjud movies.genre matnlaridan genres va movie_genres'ni to'ldirish"""
+        result = await conn.execute(
+            select(Movie.id, Movie.genre, Movie.views_count).where(Movie.is_active == True)
+        )
+        movies = [(movie_id, split_genres(genre), views) for movie_id, genre, views in result.all()]
+        genres = {}
+        for _, movie_genres, _ in movies:
+            for slug, name in movie_genres.items():
+                genres.setdefault(slug, name)
+        if not genres:
+            return
+        
+        genre_ids = await _ensure_genres(conn, genres)
+        rows = [
+            {'genre_id': genre_ids[slug], 'movie_id': movie_id, 'views_count': views or 0}
+            for movie_id, movie_genres, views in movies
+            for slug in movie_genres
+        ]
+        for i in range(0, len(rows), ViewBuffer.INSERT_CHUNK):
+            await conn.execute(insert(MovieGenre), rows[i:i + ViewBuffer.INSERT_CHUNK])
+        logger.info(f"Migratsiya: {len(genres)} ta janr, {len(rows)} ta bog'lanish yaratildi")
+
+    async def _seed_activity_sketches(self, conn):
+        """Har bir foydalanuvchini oxirgi aktiv kunining sketchiga qo'shish"""
+        cutoff = datetime.utcnow() - timedelta(days=90)
+        sketches: Dict[date, HyperLogLog] = {}
+        result = await conn.stream(
+            select(User.id, User.last_active).where(User.last_active >= cutoff)
+        )
+        async for user_id, last_active in result:
+            day = last_active.date()
+            if day not in sketches:
+                sketches[day] = HyperLogLog(config.ACTIVITY_HLL_PRECISION)
+            sketches[day].add(user_id)
+        
+        for day, sketch in sketches.items():
+            await conn.execute(insert(DailyActiveSketch).values(day=day, registers=sketch.to_bytes()))
+        if sketches:
+            logger.info(f"Migratsiya: {len(sketches)} kunlik aktivlik sketchi yaratildi")
+
+    async def _load_activity_sketches(self, start_day: date, end_day: date) -> Dict[date, HyperLogLog]:
+        """Oraliqdagi kunlik sketchlar (bazadagi + hali yozilmagan)"""
         async with self.session_maker() as session:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
             result = await session.execute(
-                select(func.count(User.id)).where(User.last_active >= cutoff_date)
+                select(DailyActiveSketch.day, DailyActiveSketch.registers)
+                .where(DailyActiveSketch.day >= start_day, DailyActiveSketch.day <= end_day)
             )
-            return result.scalar_one()
+            sketches = {
+                day: HyperLogLog(config.ACTIVITY_HLL_PRECISION, registers)
+                for day, registers in result.all()
+            }
+        
+        for day, pending in list(self._activity_sketches.items()):
+            if start_day <= day <= end_day:
+                if day in sketches:
+                    sketches[day].merge(pending)
+                else:
+                    sketches[day] = HyperLogLog(config.ACTIVITY_HLL_PRECISION, pending.to_bytes())
+        return sketches
+
+    async def count_active_users(self, start_day: date, end_day: date) -> int:
+        """[start_day, end_day] oralig'ida aktiv bo'lgan noyob foydalanuvchilar (taxminiy)"""
+        sketches = await self._load_activity_sketches(start_day, end_day)
+        return HyperLogLog.union(sketches.values(), config.ACTIVITY_HLL_PRECISION).count()
+
+    async def get_active_users_counts(self, periods: Sequence[int]) -> Dict[int, int]:
+        """Bir nechta davr uchun aktivlar soni: {kunlar: son}, sketchlar bir marta o'qiladi"""
+        today = datetime.utcnow().date()
+        sketches = await self._load_activity_sketches(today - timedelta(days=max(periods) - 1), today)
+        return {
+            days: HyperLogLog.union(
+                (sketch for day, sketch in sketches.items() if day > today - timedelta(days=days)),
+                config.ACTIVITY_HLL_PRECISION
+            ).count()
+            for days in periods
+        }
+
+    async def get_active_users_count(self, days: int = 7) -> int:
+        """So'nggi N kun ichida aktiv foydalanuvchilar soni"""
+        return (await self.get_active_users_counts([days]))[days]
 
     # --- Movie Methods ---
     async def add_movie(
@@ -187,71 +1154,356 @@ class Database:
                 duration=duration,
                 quality=quality,
                 imdb_rating=imdb_rating,
-                thumbnail_file_id=thumbnail_file_id
+                thumbnail_file_id=thumbnail_file_id,
+                **movie_search_fields(title, genre, description, country)
             )
             session.add(movie)
+            await session.flush()
+            await self._sync_movie_genres(session, movie.id, genre, 0, True)
+            await session.execute(_bump_counter('movies', 1))
             await session.commit()
             await session.refresh(movie)
-            return movie
+        self._apply_to_catalog(lambda catalog: catalog.upsert(movie))
+        await self._offer_to_leaderboards([movie])
+        return movie
 
-    async def get_movie_by_code(self, code: int) -> Optional[Movie]:
+    async def get_movie_by_code(self, code: int) -> Optional[MovieRecord]:
+        # Kod eskirgan id'ga ishora qilishi mumkin (kod tahrirlangan) — shuning uchun tekshiramiz
+        record = self._movie_cache.get(self._movie_ids_by_code.get(code))
+        if record is not None and record.code == code and record.is_active:
+            return record
+        
         async with self.session_maker() as session:
             result = await session.execute(
                 select(Movie).where(Movie.code == code, Movie.is_active == True)
             )
-            return result.scalars().first()
+            movie = result.scalars().first()
+        return self._cache_movie(movie) if movie else None
 
-    async def get_movie_by_id(self, movie_id: int) -> Optional[Movie]:
+    async def get_movie_by_id(self, movie_id: int) -> Optional[MovieRecord]:
+        record = self._movie_cache.get(movie_id)
+        if record is not None:
+            return record
+        
         async with self.session_maker() as session:
             result = await session.execute(select(Movie).where(Movie.id == movie_id))
-            return result.scalars().first()
+            movie = result.scalars().first()
+        return self._cache_movie(movie) if movie else None
+
+    def _cache_movie(self, movie: Movie) -> MovieRecord:
+        return self._remember_movie(MovieRecord.from_orm(movie))
+
+    def _remember_movie(self, record: MovieRecord) -> MovieRecord:
+        self._movie_cache.set(record.id, record)
+        self._movie_ids_by_code.set(record.code, record.id)
+        return record
+
+    def invalidate_movie(self, movie_id: int):
+        """Kinoni keshdan chiqarish"""
+        record = self._movie_cache.pop(movie_id)
+        if record is not None:
+            self._movie_ids_by_code.pop(record.code)
+
+    def movie_cache_stats(self) -> dict:
+        return self._movie_cache.stats()
+
+    @staticmethod
+    def _new_catalog() -> CatalogIndex:
+        return CatalogIndex(
+            similarity_threshold=config.SEARCH_SIMILARITY_THRESHOLD,
+            similarity_weight=config.SEARCH_SIMILARITY_WEIGHT,
+            views_weight=config.SEARCH_VIEWS_WEIGHT
+        )
+
+    def _apply_to_catalog(self, change: Callable[[CatalogIndex], None]):
+        """O'zgarishni joriy indeksga qo'llash (qurilayotgan bo'lsa, yangisi uchun yozib qo'yish)"""
+        change(self.catalog)
+        if self._catalog_changes is not None:
+            self._catalog_changes.append(change)
+
+    async def rebuild_catalog(self):
+        """
+        Inline qidiruv indeksini bazadan qayta qurish (o'lik slotlar tozalanadi,
+        ko'rishlar soni yangilanadi). O'qish va qurish vaqtida yozuvlar kutmaydi:
+        ular joriy indeksga qo'llanadi va yozib boriladi, almashtirishdan oldin
+        yangi indeksga qayta qo'llanadi (qiymatlar absolyut — takrorlash xavfsiz).
+        """
+        async with self._catalog_rebuild_lock:
+            # Jurnal o'qishdan oldin ochiladi: o'qilgan holatdan keyingi hech narsa yo'qolmaydi
+            self._catalog_changes = []
+            try:
+                async with self.session_maker() as session:
+                    result = await session.execute(select(*CATALOG_COLUMNS).where(Movie.is_active == True))
+                    rows = result.all()
+                catalog = self._new_catalog()
+                # Qurish sekundlab davom etishi mumkin — event loop bloklanmasligi uchun oqimda
+                await asyncio.to_thread(catalog.load, rows)
+                
+                # Qayta qo'llash va almashtirish orasida await yo'q — yangi o'zgarish tushib qolmaydi
+                for change in self._catalog_changes:
+                    change(catalog)
+                self.catalog = catalog
+            finally:
+                self._catalog_changes = None
+
+    async def run_catalog_rebuild(self):
+        """Fon vazifasi: katalog indeksini davriy qayta qurish"""
+        while True:
+            await asyncio.sleep(config.CATALOG_REBUILD_INTERVAL)
+            try:
+                await self.rebuild_catalog()
+            except Exception as e:
+                logger.error(f"Katalog indeksini qurishda xatolik: {e}")
+
+    async def search_catalog(self, query: str, limit: int = 20, offset: str = "") -> Tuple[list, str]:
+        """
+        Inline qidiruv sahifasi: (natijalar, keyingi sahifa offset'i).
+        Xotiradagi indeks (score, id) kursori bilan sahifalanadi; u hali
+        yuklanmagan bo'lsa — bazadan faqat birinchi sahifa.
+        """
+        if not self.catalog.loaded:
+            if offset:
+                return [], ""
+            return list(await self.search_movies(query, limit)), ""
+        
+        try:
+            after = decode_cursor(offset)
+        except ValueError:
+            return [], ""
+        hits = self.catalog.search(query, limit, after=after)
+        next_offset = encode_cursor(hits[-1]) if len(hits) == limit else ""
+        return hits, next_offset
+
+    @staticmethod
+    def _search_stmt(query: str, limit: int):
+        """
+        Qidiruv so'rovi. So'rov ham, saqlangan matnlar ham translit.normalize
+        orqali bir ko'rinishga keltirilgan, shuning uchun lotin/kirill farqi yo'q.
+        Nom bo'yicha (pg_trgm, xatolarga chidamli) va to'liq matn bo'yicha
+        (search_vector, prefiks) nomzodlar alohida tanlanadi, so'ng o'xshashlik
+        va ko'rishlar aralashmasi bo'yicha saralanadi.
+        Returns: so'rov yoki None (normalizatsiyadan keyin bo'sh so'rov)
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return None
+        
+        ts_query = func.to_tsquery('simple', " & ".join(f"{term}:*" for term in normalized.split()))
+        popularity = func.ln(Movie.views_count + 1) * config.SEARCH_VIEWS_WEIGHT
+        title_similarity = func.word_similarity(normalized, Movie.search_title)
+        score = func.greatest(
+            title_similarity,
+            func.ts_rank(Movie.search_vector, ts_query)
+        ) * config.SEARCH_SIMILARITY_WEIGHT + popularity
+        
+        title_hits = (
+            select(Movie.id)
+            .where(
+                Movie.is_active == True,
+                # search_title %> query — xato yozilgan so'rovlar uchun (word_similarity)
+                Movie.search_title.contains(normalized, autoescape=True)
+                | Movie.search_title.op('%>')(normalized)
+            )
+            .order_by((title_similarity * config.SEARCH_SIMILARITY_WEIGHT + popularity).desc())
+            .limit(limit)
+        )
+        # Keng so'rovlarda (masalan, janr) minglab qatorlar uchun reyting hisoblanmaydi
+        text_hits = (
+            select(Movie.id)
+            .where(Movie.is_active == True, Movie.search_vector.op('@@')(ts_query))
+            .order_by(Movie.views_count.desc())
+            .limit(limit)
+        )
+        candidates = title_hits.union(text_hits).subquery()
+        return (
+            select(Movie)
+            .where(Movie.id.in_(select(candidates.c.id)))
+            .order_by(score.desc(), Movie.id)
+            .limit(limit)
+        )
 
     async def search_movies(self, query: str, limit: int = 10) -> Sequence[Movie]:
         """Kino qidirish"""
+        stmt = self._search_stmt(query, limit)
+        if stmt is None:
+            return []
         async with self.session_maker() as session:
-            search_pattern = f"%{query}%"
-            result = await session.execute(
-                select(Movie)
-                .where(
-                    Movie.is_active == True,
-                    (Movie.title.ilike(search_pattern) | Movie.genre.ilike(search_pattern))
-                )
-                .order_by(Movie.views_count.desc())
-                .limit(limit)
-            )
+            result = await session.execute(stmt)
             return result.scalars().all()
 
-    async def get_movies_by_genre(self, genre: str, limit: int = 20) -> Sequence[Movie]:
+    # --- Janrlar ---
+    @staticmethod
+    async def _sync_movie_genres(session, movie_id: int, genre: str, views_count: int, is_active: bool):
+        """movie_genres qatorlarini kinoning janr matniga moslash"""
+        await session.execute(delete(MovieGenre).where(MovieGenre.movie_id == movie_id))
+        genres = split_genres(genre) if is_active else {}
+        if not genres:
+            return
+        
+        genre_ids = await _ensure_genres(session, genres)
+        await session.execute(insert(MovieGenre), [
+            {'genre_id': genre_id, 'movie_id': movie_id, 'views_count': views_count or 0}
+            for genre_id in genre_ids.values()
+        ])
+
+    async def get_genres(self) -> Sequence[Tuple[int, str, int]]:
+        """Faol kinolari bor janrlar: (id, nom, kinolar soni), ko'pidan oziga"""
         async with self.session_maker() as session:
+            movies_count = func.count(MovieGenre.movie_id)
             result = await session.execute(
-                select(Movie)
-                .where(Movie.genre.ilike(f"%{genre}%"), Movie.is_active == True)
-                .order_by(Movie.views_count.desc())
-                .limit(limit)
+                select(Genre.id, Genre.name, movies_count)
+                .join(MovieGenre, MovieGenre.genre_id == Genre.id)
+                .group_by(Genre.id)
+                .order_by(movies_count.desc(), Genre.name)
             )
-            return result.scalars().all()
+            return result.all()
 
-    async def get_top_movies(self, limit: int = 10) -> Sequence[Movie]:
-        """Eng ko'p ko'rilgan kinolar"""
+    async def get_genre(self, genre_id: int) -> Optional[Genre]:
         async with self.session_maker() as session:
-            result = await session.execute(
-                select(Movie)
-                .where(Movie.is_active == True)
-                .order_by(Movie.views_count.desc())
-                .limit(limit)
-            )
-            return result.scalars().all()
+            return await session.get(Genre, genre_id)
+
+    async def get_genre_movies(
+        self,
+        genre_id: int,
+        limit: int = 10,
+        cursor: Optional[Tuple[int, int]] = None,
+        backward: bool = False
+    ) -> Tuple[List[Tuple[Movie, tuple]], bool]:
+        """Janr kinolari, ko'p ko'rilganidan (idx_movie_genres_cursor bo'yicha)"""
+        stmt = (
+            select(Movie)
+            .join(MovieGenre, MovieGenre.movie_id == Movie.id)
+            .where(MovieGenre.genre_id == genre_id)
+        )
+        return await self._keyset_page(
+            stmt, (MovieGenre.views_count, MovieGenre.movie_id), limit, cursor, backward
+        )
 
-    async def get_recent_movies(self, limit: int = 10) -> Sequence[Movie]:
-        """Yangi qo'shilgan kinolar"""
+    async def get_movies_by_genre(self, genre: str, limit: int = 20) -> Sequence[Movie]:
+        """Janr nomi bo'yicha (yozilishidan qat'i nazar) kinolar"""
         async with self.session_maker() as session:
-            result = await session.execute(
-                select(Movie)
-                .where(Movie.is_active == True)
-                .order_by(Movie.added_at.desc())
-                .limit(limit)
-            )
-            return result.scalars().all()
+            genre_id = (await session.execute(
+                select(Genre.id).where(Genre.slug == normalize(genre))
+            )).scalar_one_or_none()
+        if genre_id is None:
+            return []
+        rows, _ = await self.get_genre_movies(genre_id, limit)
+        return [movie for movie, _ in rows]
+
+    async def _keyset_page(
+        self,
+        stmt,
+        sort_key: tuple,
+        limit: int,
+        cursor: Optional[tuple] = None,
+        backward: bool = False
+    ) -> Tuple[List[Tuple[Movie, tuple]], bool]:
+        """
+        Keyset sahifa: sort_key bo'yicha kamayish tartibida, kursordan keyin
+        (backward=True — kursordan oldingi sahifa). Chuqur sahifalar ham birinchi
+        sahifa kabi indeks oralig'ini o'qiydi, OFFSET yo'q.
+        Returns: ([(kino, kalit qiymatlari)], shu yo'nalishda yana sahifa bormi)
+        """
+        if cursor is not None:
+            key = tuple_(*sort_key)
+            stmt = stmt.where(key > tuple_(*cursor) if backward else key < tuple_(*cursor))
+        order = [column.asc() if backward else column.desc() for column in sort_key]
+        stmt = stmt.add_columns(*sort_key).order_by(*order).limit(limit + 1)
+        
+        async with self.session_maker() as session:
+            result = await session.execute(stmt)
+            rows = [(row[0], tuple(row[1:])) for row in result.all()]
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return (rows[::-1] if backward else rows), has_more
+
+    async def get_top_movies(
+        self,
+        limit: int = 10,
+        cursor: Optional[Tuple[int, int]] = None,
+        backward: bool = False
+    ) -> Tuple[List[Tuple[Movie, tuple]], bool]:
+        """Eng ko'p ko'rilgan kinolar (idx_movie_top bo'yicha)"""
+        stmt = select(Movie).where(Movie.is_active == True)
+        return await self._keyset_page(stmt, (Movie.views_count, Movie.id), limit, cursor, backward)
+
+    async def get_recent_movies(
+        self,
+        limit: int = 10,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        backward: bool = False
+    ) -> Tuple[List[Tuple[Movie, tuple]], bool]:
+        """Yangi qo'shilgan kinolar (idx_movie_new bo'yicha)"""
+        stmt = select(Movie).where(Movie.is_active == True)
+        return await self._keyset_page(stmt, (Movie.added_at, Movie.id), limit, cursor, backward)
+
+    @staticmethod
+    def _new_leaderboards() -> Dict[str, Leaderboard]:
+        size = {'capacity': config.LEADERBOARD_SIZE, 'page_size': config.MOVIES_PAGE_SIZE}
+        return {
+            'top': Leaderboard(lambda e: (e.views_count, e.id), **size),
+            'new': Leaderboard(lambda e: (e.added_at, e.id), **size),
+            'rated': Leaderboard(
+                lambda e: (e.rating_sum / e.rating_count, e.rating_count, e.id),
+                accepts=lambda e: e.rating_count >= config.LEADERBOARD_MIN_RATINGS,
+                **size
+            ),
+        }
+
+    @staticmethod
+    def _leaderboard_stmt(name: str, limit: int):
+        """Leaderboard tartibi bazada (keyset indekslari bilan bir xil)"""
+        stmt = select(*LEADERBOARD_COLUMNS).where(Movie.is_active == True)
+        if name == 'top':
+            order = (Movie.views_count.desc(), Movie.id.desc())
+        elif name == 'new':
+            order = (Movie.added_at.desc(), Movie.id.desc())
+        else:
+            stmt = stmt.where(Movie.rating_count >= config.LEADERBOARD_MIN_RATINGS)
+            order = (RATING_AVERAGE.desc(), Movie.rating_count.desc(), Movie.id.desc())
+        return stmt.order_by(*order).limit(limit)
+
+    async def get_leaderboard(self, name: str) -> Leaderboard:
+        """'top', 'new' yoki 'rated' ro'yxati (eskirgan bo'lsa — bazadan yuklanadi)"""
+        board = self.leaderboards[name]
+        if board.stale:
+            async with self._leaderboard_lock:
+                if board.stale:
+                    await self._load_leaderboard(name)
+        return board
+
+    async def _load_leaderboard(self, name: str):
+        board = self.leaderboards[name]
+        async with self.session_maker() as session:
+            result = await session.execute(self._leaderboard_stmt(name, board.capacity))
+            board.load([BoardEntry.from_row(row) for row in result.all()])
+
+    async def reconcile_leaderboards(self):
+        """Barcha ro'yxatlarni bazadan qayta o'qish (qo'lda kiritilgan o'zgarishlar uchun)"""
+        async with self._leaderboard_lock:
+            for name in self.leaderboards:
+                await self._load_leaderboard(name)
+
+    async def run_leaderboard_reconcile(self):
+        """Fon vazifasi: ro'yxatlarni davriy solishtirish"""
+        while True:
+            await asyncio.sleep(config.LEADERBOARD_RECONCILE_INTERVAL)
+            try:
+                await self.reconcile_leaderboards()
+            except Exception as e:
+                logger.error(f"Ro'yxatlarni yangilashda xatolik: {e}")
+
+    async def _offer_to_leaderboards(self, rows):
+        """O'zgargan kino qatorlarini (LEADERBOARD_COLUMNS) ro'yxatlarga qo'llash"""
+        async with self._leaderboard_lock:
+            for row in rows:
+                entry = BoardEntry.from_row(row)
+                for board in self.leaderboards.values():
+                    if row.is_active:
+                        board.offer(entry)
+                    else:
+                        board.remove(entry.id)
 
     async def get_movies_count(self) -> int:
         async with self.session_maker() as session:
@@ -264,9 +1516,36 @@ class Database:
     async def update_movie(self, movie_id: int, **kwargs):
         """Kino ma'lumotlarini yangilash"""
         async with self.session_maker() as session:
-            stmt = update(Movie).where(Movie.id == movie_id).values(**kwargs)
-            await session.execute(stmt)
+            if _SEARCH_SOURCE_FIELDS & kwargs.keys():
+                # Qidiruv matnlari o'zgarmagan maydonlar bilan birga qayta hisoblanadi
+                current = (await session.execute(
+                    select(Movie.title, Movie.genre, Movie.description, Movie.country)
+                    .where(Movie.id == movie_id)
+                )).first()
+                if current is not None:
+                    source = {**current._mapping, **kwargs}
+                    kwargs.update(movie_search_fields(
+                        source['title'], source['genre'], source['description'], source['country']
+                    ))
+            
+            stmt = update(Movie).where(Movie.id == movie_id).values(version=Movie.version + 1, **kwargs)
+            if 'is_active' in kwargs:
+                # Faol kinolar hisoblagichi uchun eski holat kerak
+                old_active = (await session.execute(
+                    select(Movie.is_active).where(Movie.id == movie_id).with_for_update()
+                )).scalar_one_or_none()
+                if old_active is not None and old_active != kwargs['is_active']:
+                    await session.execute(_bump_counter('movies', 1 if kwargs['is_active'] else -1))
+            updated = (await session.execute(stmt.returning(*LEADERBOARD_COLUMNS))).first()
+            if updated is not None and ('genre' in kwargs or 'is_active' in kwargs):
+                await self._sync_movie_genres(
+                    session, movie_id, updated.genre, updated.views_count, updated.is_active
+                )
             await session.commit()
+        self.invalidate_movie(movie_id)
+        if updated is not None:
+            self._apply_to_catalog(lambda catalog: catalog.upsert(updated))
+            await self._offer_to_leaderboards([updated])
 
     # --- KINO O'CHIRISH UCHUN YANGILANGAN QISM ---
     async def delete_movie(self, movie_id: int):
@@ -274,59 +1553,206 @@ class Database:
         # Faqat is_active=False emas, balki to'liq o'chirishni tanlaymiz,
         # chunki admin.py dagi 'confirm_delete_movie' faqat kino ID si bilan chaqirmoqda.
         async with self.session_maker() as session:
-            stmt = delete(Movie).where(Movie.id == movie_id)
-            await session.execute(stmt)
+            stmt = delete(Movie).where(Movie.id == movie_id).returning(Movie.is_active)
+            result = await session.execute(stmt)
+            if result.scalar():
+                await session.execute(_bump_counter('movies', -1))
             await session.commit()
+        self.invalidate_movie(movie_id)
+        self._apply_to_catalog(lambda catalog: catalog.remove(movie_id))
+        async with self._leaderboard_lock:
+            for board in self.leaderboards.values():
+                board.remove(movie_id)
             
     # --- Channel Methods ---
     async def get_required_channels(self) -> Sequence[RequiredChannel]:
+        snapshot = self._channels_snapshot
+        if snapshot is not None and snapshot[0] == self._channels_version:
+            return snapshot[1]
+        
+        # So'rov paytida versiya o'zgarsa, snapshot keyingi safar yangilanadi
+        version = self._channels_version
         async with self.session_maker() as session:
             result = await session.execute(
                 select(RequiredChannel)
                 .where(RequiredChannel.is_active == True)
                 .order_by(RequiredChannel.priority.desc())
             )
-            return result.scalars().all()
+            channels = tuple(result.scalars().all())
+        
+        self._channels_snapshot = (version, channels)
+        return channels
 
     async def count_required_channels(self) -> int:
+        return len(await self.get_required_channels())
+
+    def _bump_channels_version(self):
+        self._channels_version += 1
+
+    async def add_required_channel(
+        self,
+        channel_id: int,
+        title: str,
+        priority: int = 0,
+        invite_link: str = None
+    ):
         async with self.session_maker() as session:
-            result = await session.execute(
-                select(func.count()).select_from(RequiredChannel)
-                .where(RequiredChannel.is_active == True)
+            channel = RequiredChannel(
+                channel_id=channel_id,
+                title=title,
+                priority=priority,
+                invite_link=invite_link
             )
-            return result.scalar_one()
+            session.add(channel)
+            await session.commit()
+        self._bump_channels_version()
 
-    async def add_required_channel(self, channel_id: int, title: str, priority: int = 0):
+    async def update_channel_invite_link(self, channel_id: int, invite_link: str):
         async with self.session_maker() as session:
-            channel = RequiredChannel(channel_id=channel_id, title=title, priority=priority)
-            session.add(channel)
+            stmt = (
+                update(RequiredChannel)
+                .where(RequiredChannel.channel_id == channel_id)
+                .values(invite_link=invite_link)
+            )
+            await session.execute(stmt)
             await session.commit()
+        self._bump_channels_version()
 
     async def delete_required_channel(self, channel_id: int):
         async with self.session_maker() as session:
             stmt = delete(RequiredChannel).where(RequiredChannel.channel_id == channel_id)
             await session.execute(stmt)
+            await session.execute(
+                delete(ChannelMember).where(ChannelMember.channel_id == channel_id)
+            )
             await session.commit()
+        self._bump_channels_version()
+
+    async def set_channel_member(self, channel_id: int, user_id: int, is_member: bool):
+        """Kanal a'zoligini saqlash"""
+        async with self.session_maker() as session:
+            stmt = (
+                pg_insert(ChannelMember)
+                .values(
+                    channel_id=channel_id,
+                    user_id=user_id,
+                    is_member=is_member,
+                    updated_at=datetime.utcnow()
+                )
+                .on_conflict_do_update(
+                    index_elements=[ChannelMember.channel_id, ChannelMember.user_id],
+                    set_={'is_member': is_member, 'updated_at': datetime.utcnow()}
+                )
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    async def get_channel_members(self, since: datetime = None) -> Sequence[Tuple[int, int, bool, datetime]]:
+        """Majburiy kanallar a'zoligi: (channel_id, user_id, is_member, updated_at)"""
+        async with self.session_maker() as session:
+            stmt = (
+                select(
+                    ChannelMember.channel_id, ChannelMember.user_id,
+                    ChannelMember.is_member, ChannelMember.updated_at
+                )
+                .join(RequiredChannel, RequiredChannel.channel_id == ChannelMember.channel_id)
+                .where(RequiredChannel.is_active == True)
+            )
+            if since is not None:
+                stmt = stmt.where(ChannelMember.updated_at > since)
+            result = await session.execute(stmt)
+            return result.all()
 
     # --- Views & Ratings ---
     async def add_movie_view(self, user_id: int, movie_id: int):
-        """Kino ko'rilganini qayd etish"""
+        """Kino ko'rilganini qayd etish (bufer orqali, fon vazifasida yoziladi)"""
+        self.view_buffer.add(user_id, movie_id)
+
+    async def get_movie_card(
+        self,
+        code: int,
+        user_id: int
+    ) -> Optional[Tuple[MovieRecord, Tuple[float, int], Optional[int]]]:
+        """
+        Kino kartasi bitta so'rovda: kino va foydalanuvchi bahosi.
+        Ko'rish buferga qo'shiladi va fon vazifasida yoziladi.
+        Returns: (movie, (avg_rating, count), user_rating) yoki None
+        """
+        user_rating = (
+            select(MovieRating.rating)
+            .where(MovieRating.movie_id == Movie.id, MovieRating.user_id == user_id)
+            .scalar_subquery()
+        )
+        stmt = (
+            select(*(Movie.__table__.c[f.name] for f in fields(MovieRecord)), user_rating.label("user_rating"))
+            .where(Movie.code == code, Movie.is_active == True)
+        )
+        
         async with self.session_maker() as session:
-            # Ko'rishni qayd qilish
-            view = MovieView(user_id=user_id, movie_id=movie_id)
-            session.add(view)
-            
-            # Ko'rishlar sonini oshirish
-            result = await session.execute(select(Movie).where(Movie.id == movie_id))
-            movie = result.scalars().first()
-            if movie:
-                movie.views_count += 1
-            
+            result = await session.execute(stmt)
+            row = result.first()
+        
+        if row is None:
+            return None
+        
+        movie = self._remember_movie(MovieRecord.from_row(row))
+        self.view_buffer.add(user_id, movie.id)
+        return movie, movie.rating, row.user_rating
+
+    async def fold_view_counters(self) -> int:
+        """Hisoblagich slotlarini movies/movie_genres.views_count'ga qo'shish (bitta atomar so'rov)"""
+        async with self.session_maker() as session:
+            result = await session.execute(text(
+                "WITH folded AS ("
+                "  DELETE FROM movie_view_counters RETURNING movie_id, views"
+                "), totals AS ("
+                "  SELECT movie_id, SUM(views) AS views FROM folded GROUP BY movie_id"
+                "), genre_views AS ("
+                "  UPDATE movie_genres SET views_count = movie_genres.views_count + totals.views "
+                "  FROM totals WHERE movie_genres.movie_id = totals.movie_id"
+                ") "
+                "UPDATE movies SET views_count = movies.views_count + totals.views "
+                "FROM totals WHERE movies.id = totals.movie_id "
+                "RETURNING movies.id, movies.code, movies.title, movies.genre, movies.quality, "
+                "movies.views_count, movies.rating_sum, movies.rating_count, movies.added_at, movies.is_active"
+            ))
+            rows = result.all()
             await session.commit()
+        # Yangi ko'rishlar soni top ro'yxatga shu yerda yetkaziladi
+        await self._offer_to_leaderboards(rows)
+        return len(rows)
+
+    async def run_view_counter_fold(self):
+        """Fon vazifasi: slotlarni davriy yig'ish"""
+        while True:
+            await asyncio.sleep(config.VIEW_FOLD_INTERVAL)
+            try:
+                await asyncio.shield(self.fold_view_counters())
+            except Exception as e:
+                logger.error(f"Ko'rishlar hisoblagichini yig'ishda xatolik: {e}")
 
     async def add_rating(self, user_id: int, movie_id: int, rating: int, review: str = None):
-        """Kinoga baho berish"""
+        """Kinoga baho berish (agregatlar shu tranzaksiyada yangilanadi)"""
+        if user_id in self._pending_users:
+            # movie_ratings.user_id FK uchun foydalanuvchi avval yozilishi kerak
+            await self.flush_user_activity()
+        
         async with self.session_maker() as session:
+            # Kino qatorini bloklaymiz — bir vaqtdagi baholar agregatni buzmasligi uchun
+            locked = await session.execute(
+                select(Movie.id).where(Movie.id == movie_id).with_for_update()
+            )
+            if locked.first() is None:
+                return
+            
+            old_result = await session.execute(
+                select(MovieRating.rating).where(
+                    MovieRating.user_id == user_id,
+                    MovieRating.movie_id == movie_id
+                )
+            )
+            old_rating = old_result.scalar_one_or_none()
+            
             stmt = (
                 pg_insert(MovieRating)
                 .values(user_id=user_id, movie_id=movie_id, rating=rating, review=review)
@@ -336,19 +1762,34 @@ class Database:
                 )
             )
             await session.execute(stmt)
+            
+            # Eski baho o'rniga yangisini qo'llash
+            deltas = {'rating_sum': Movie.rating_sum + rating - (old_rating or 0)}
+            if old_rating is None:
+                deltas['rating_count'] = Movie.rating_count + 1
+            if old_rating != rating:
+                deltas[f'rating_{rating}'] = getattr(Movie, f'rating_{rating}') + 1
+                if old_rating is not None:
+                    deltas[f'rating_{old_rating}'] = getattr(Movie, f'rating_{old_rating}') - 1
+            updated = (await session.execute(
+                update(Movie).where(Movie.id == movie_id).values(**deltas)
+                .returning(*LEADERBOARD_COLUMNS)
+            )).first()
             await session.commit()
+        self.invalidate_movie(movie_id)
+        self._apply_to_catalog(
+            lambda catalog: catalog.set_rating(movie_id, updated.rating_sum, updated.rating_count)
+        )
+        await self._offer_to_leaderboards([updated])
 
     async def get_movie_rating(self, movie_id: int) -> Tuple[float, int]:
         """Kino reytingini olish (o'rtacha baho, baholar soni)"""
         async with self.session_maker() as session:
             result = await session.execute(
-                select(
-                    func.avg(MovieRating.rating),
-                    func.count(MovieRating.id)
-                ).where(MovieRating.movie_id == movie_id)
+                select(Movie.rating_sum, Movie.rating_count).where(Movie.id == movie_id)
             )
-            avg_rating, count = result.first()
-            return (round(avg_rating, 1) if avg_rating else 0.0, count or 0)
+            row = result.first()
+            return _average_rating(*row) if row else (0.0, 0)
 
     async def get_user_movie_rating(self, user_id: int, movie_id: int) -> Optional[MovieRating]:
         """Foydalanuvchining kinoga bergan bahoini olish"""
@@ -361,15 +1802,28 @@ class Database:
             )
             return result.scalars().first()
 
+    async def get_movie_view_history(self, movie_id: int, days: int = 7) -> Tuple[int, int]:
+        """So'nggi N kundagi (ko'rishlar, kunlik noyob tomoshabinlar yig'indisi)"""
+        async with self.session_maker() as session:
+            cutoff = datetime.utcnow().date() - timedelta(days=days - 1)
+            result = await session.execute(
+                select(
+                    func.coalesce(func.sum(MovieViewDaily.views), 0),
+                    func.coalesce(func.sum(MovieViewDaily.unique_viewers), 0)
+                ).where(MovieViewDaily.movie_id == movie_id, MovieViewDaily.day >= cutoff)
+            )
+            views, viewers = result.first()
+            return int(views), int(viewers)
+
     # --- Statistics ---
     async def get_user_stats(self, user_id: int) -> dict:
         """Foydalanuvchi statistikasi"""
         async with self.session_maker() as session:
-            # Ko'rilgan kinolar soni
+            # Ko'rishlar soni (users.views_count — xom ko'rishlar retention'idan mustaqil)
             views_result = await session.execute(
-                select(func.count(MovieView.id)).where(MovieView.user_id == user_id)
+                select(User.views_count).where(User.id == user_id)
             )
-            views_count = views_result.scalar_one()
+            views_count = views_result.scalar_one_or_none() or 0
             
             # Berilgan baholar soni
             ratings_result = await session.execute(
@@ -383,16 +1837,57 @@ class Database:
             }
 
     async def get_global_stats(self) -> dict:
-        """Umumiy statistika"""
+        """Umumiy statistika (hisoblagichlar jadvalidan)"""
         async with self.session_maker() as session:
-            users_count = await self.get_users_count()
-            movies_count = await self.get_movies_count()
-            
-            views_result = await session.execute(select(func.count(MovieView.id)))
-            total_views = views_result.scalar_one()
+            result = await session.execute(select(GlobalCounter.name, GlobalCounter.value))
+            counters = dict(result.all())
             
             return {
-                'users_count': users_count,
-                'movies_count': movies_count,
-                'total_views': total_views
-  }
+                'users_count': counters.get('users', 0),
+                'movies_count': counters.get('movies', 0),
+                'total_views': counters.get('views', 0)
+            }
+
+    async def get_admin_stats(self, force: bool = False) -> dict:
+        """
+        Admin panel statistikasi: hisoblagichlar bitta so'rovda, aktivlar kunlik
+        sketchlardan. Natija ADMIN_STATS_TTL soniya keshlanadi.
+        'refreshed_at' — ma'lumot yig'ilgan vaqt (UTC)
+        """
+        cached = self._admin_stats
+        if cached and not force and time.monotonic() - cached[0] < config.ADMIN_STATS_TTL:
+            return cached[1]
+        
+        now = datetime.utcnow()
+        
+        def counter(name: str):
+            return (
+                select(GlobalCounter.value)
+                .where(GlobalCounter.name == name)
+                .scalar_subquery()
+            )
+        
+        channels_count = (
+            select(func.count(RequiredChannel.id))
+            .where(RequiredChannel.is_active == True)
+            .scalar_subquery()
+        )
+        stmt = select(
+            counter('users').label('users_count'),
+            counter('movies').label('movies_count'),
+            counter('views').label('total_views'),
+            channels_count.label('channels_count')
+        )
+        
+        async with self.session_maker() as session:
+            row = (await session.execute(stmt)).first()
+        
+        stats = {key: value or 0 for key, value in row._mapping.items()}
+        
+        # Aktivlar kunlik sketchlardan — users jadvali skan qilinmaydi
+        active = await self.get_active_users_counts([7, 30])
+        stats['active_7'] = active[7]
+        stats['active_30'] = active[30]
+        stats['refreshed_at'] = now
+        self._admin_stats = (time.monotonic(), stats)
+        return stats
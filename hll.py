@@ -0,0 +1,57 @@
+import hashlib
+import math
+from typing import Iterable, Optional
+
+
+class HyperLogLog:
+    """
+    Noyob elementlar sonini taxminiy hisoblovchi sketch.
+    Sketchlar registrlar bo'yicha maksimum olish orqali birlashtiriladi,
+    shuning uchun kunlik sketchlardan istalgan oraliq uchun son olinadi.
+    Xatolik taxminan 1.04 / sqrt(2 ** precision).
+    """
+
+    def __init__(self, precision: int = 14, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is not None and len(registers) != self.size:
+            raise ValueError(f"Registrlar soni {self.size} bo'lishi kerak, {len(registers)} berildi")
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value: int):
+        digest = hashlib.blake2b(value.to_bytes(8, "big", signed=True), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+
+        index = hashed >> (64 - self.precision)
+        remainder_bits = 64 - self.precision
+        remainder = hashed & ((1 << remainder_bits) - 1)
+        rank = remainder_bits - remainder.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Turli aniqlikdagi sketchlarni birlashtirib bo'lmaydi")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int = 14) -> "HyperLogLog":
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -r for r in self.registers)
+
+        # Kichik qiymatlar uchun linear counting aniqroq
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
@@ -1,17 +1,28 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
+from functools import lru_cache
 
+from config import config
+from translit import normalize
+
+# Klaviaturalar bir marta quriladi va barcha xabarlarda bitta nusxasi ishlatiladi (lru_cache).
+# Qaytarilgan markup umumiy obyekt: chaqiruvchilar uni o'zgartirmasligi kerak
+# (tugma qo'shish kerak bo'lsa — InlineKeyboardBuilder.from_markup(...) bilan nusxa oling)
+
+@lru_cache(maxsize=None)
 def get_main_menu_kb() -> ReplyKeyboardMarkup:
     """Asosiy menu klaviaturasi"""
     kb = ReplyKeyboardBuilder()
     kb.button(text="🔍 Qidirish")
     kb.button(text="🎬 Top kinolar")
     kb.button(text="🆕 Yangi kinolar")
+    kb.button(text="🎭 Janrlar")
     kb.button(text="📊 Statistika")
     kb.button(text="ℹ️ Ma'lumot")
-    kb.adjust(2, 2, 1)
+    kb.adjust(2, 2, 2)
     return kb.as_markup(resize_keyboard=True)
 
+@lru_cache(maxsize=None)
 def get_admin_panel_kb() -> InlineKeyboardMarkup:
     """Admin panel klaviaturasi"""
     kb = InlineKeyboardBuilder()
@@ -24,12 +35,14 @@ def get_admin_panel_kb() -> InlineKeyboardMarkup:
     kb.adjust(2)
     return kb.as_markup()
 
+@lru_cache(maxsize=None)
 def get_back_to_admin_kb() -> InlineKeyboardMarkup:
     """Admin panelga qaytish tugmasi"""
     kb = InlineKeyboardBuilder()
     kb.button(text="⬅️ Ortga", callback_data="admin_panel_back")
     return kb.as_markup()
 
+@lru_cache(maxsize=None)
 def get_cancel_kb() -> InlineKeyboardMarkup:
     """Bekor qilish tugmasi"""
     kb = InlineKeyboardBuilder()
@@ -37,6 +50,7 @@ def get_cancel_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 # --- KINO TAHRIRLASH UCHUN YANGI KLAVIATURA QO'SHILDI ---
+@lru_cache(maxsize=None)
 def get_edit_movie_fields_kb() -> InlineKeyboardMarkup:
     """Kino tahrirlash uchun maydonlarni tanlash klaviaturasi"""
     kb = InlineKeyboardBuilder()
@@ -68,6 +82,7 @@ def get_edit_movie_fields_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 # -------------------------------------------------------------------
 
+@lru_cache(maxsize=config.MOVIE_CACHE_SIZE)
 def get_movie_actions_kb(movie_code: int, user_rated: bool = False) -> InlineKeyboardMarkup:
     """Kino uchun amallar klaviaturasi"""
     kb = InlineKeyboardBuilder()
@@ -79,6 +94,7 @@ def get_movie_actions_kb(movie_code: int, user_rated: bool = False) -> InlineKey
     kb.adjust(2)
     return kb.as_markup()
 
+@lru_cache(maxsize=config.MOVIE_CACHE_SIZE)
 def get_rating_kb(movie_code: int) -> InlineKeyboardMarkup:
     """Baho berish klaviaturasi"""
     kb = InlineKeyboardBuilder()
@@ -88,34 +104,44 @@ def get_rating_kb(movie_code: int) -> InlineKeyboardMarkup:
     kb.adjust(5, 1)
     return kb.as_markup()
 
-def get_genre_kb() -> InlineKeyboardMarkup:
-    """Janr tanlash klaviaturasi"""
-    genres = [
-        "🎭 Drama", "😂 Komediya", "🔫 Jangari",
-        "💕 Romantik", "😱 Qo'rqinchli", "🔬 Fantastika",
-        "🎪 Sarguzasht", "🎬 Thriller", "🎨 Multfilm"
-    ]
+# Janr slug'i (translit.normalize) -> emoji
+GENRE_EMOJIS = {
+    "drama": "🎭", "komediya": "😂", "jangari": "🔫",
+    "romantik": "💕", "korkinchli": "😱", "fantastika": "🔬",
+    "sarguzasht": "🎪", "thriller": "🎬", "triller": "🎬", "multfilm": "🎨"
+}
+
+def get_genre_kb(genres) -> InlineKeyboardMarkup:
+    """Janr tanlash klaviaturasi: genres — (id, nom, kinolar soni)"""
     kb = InlineKeyboardBuilder()
-    for genre in genres:
-        kb.button(text=genre, callback_data=f"genre_{genre.split()[1]}")
+    for genre_id, name, movies_count in genres:
+        emoji = GENRE_EMOJIS.get(normalize(name), "🎬")
+        kb.button(text=f"{emoji} {name} ({movies_count})", callback_data=f"genre_{genre_id}")
     kb.button(text="⬅️ Ortga", callback_data="back_to_menu")
     kb.adjust(3)
     return kb.as_markup()
 
-def get_pagination_kb(current_page: int, total_pages: int, prefix: str = "page") -> InlineKeyboardMarkup:
-    """Pagination klaviaturasi"""
+def get_pagination_kb(
+    page: int,
+    prev_callback: str = None,
+    next_callback: str = None,
+    back_callback: str = None
+) -> InlineKeyboardMarkup:
+    """Pagination klaviaturasi (keyset kursorlari callback_data ichida)"""
     kb = InlineKeyboardBuilder()
     
     buttons = []
-    if current_page > 1:
-        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}_{current_page-1}"))
+    if prev_callback:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=prev_callback))
     
-    buttons.append(InlineKeyboardButton(text=f"{current_page}/{total_pages}", callback_data="current_page"))
+    buttons.append(InlineKeyboardButton(text=f"{page}-sahifa", callback_data="current_page"))
     
-    if current_page < total_pages:
-        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}_{current_page+1}"))
+    if next_callback:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=next_callback))
     
     kb.row(*buttons)
+    if back_callback:
+        kb.row(InlineKeyboardButton(text="⬅️ Ortga", callback_data=back_callback))
     return kb.as_markup()
 
 def get_confirmation_kb(action: str) -> InlineKeyboardMarkup:
@@ -127,6 +153,7 @@ def get_confirmation_kb(action: str) -> InlineKeyboardMarkup:
     kb.adjust(2)
     return kb.as_markup()
 
+@lru_cache(maxsize=None)
 def get_broadcast_kb() -> InlineKeyboardMarkup:
     """Rassilka klaviaturasi"""
     kb = InlineKeyboardBuilder()
@@ -136,6 +163,7 @@ def get_broadcast_kb() -> InlineKeyboardMarkup:
     kb.adjust(2, 1)
     return kb.as_markup()
 
+@lru_cache(maxsize=None)
 def get_quality_kb() -> InlineKeyboardMarkup:
     """Sifat tanlash klaviaturasi"""
     qualities = ["CAM", "HD", "Full HD", "4K"]
@@ -0,0 +1,124 @@
+from datetime import datetime
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+
+class BoardEntry(NamedTuple):
+    """Ro'yxatda ko'rsatiladigan kino maydonlari"""
+    id: int
+    code: int
+    title: str
+    genre: str
+    quality: str
+    views_count: int
+    rating_sum: int
+    rating_count: int
+    added_at: datetime
+
+    @property
+    def rating(self) -> Tuple[float, int]:
+        if not self.rating_count:
+            return 0.0, 0
+        return round(self.rating_sum / self.rating_count, 1), self.rating_count
+
+    @classmethod
+    def from_row(cls, row) -> "BoardEntry":
+        """Natija qatori yoki Movie obyektidan"""
+        return cls(**{name: getattr(row, name) for name in cls._fields})
+
+
+class Leaderboard:
+    """
+    Bazadagi tartibning boshidagi `capacity` ta kino (xotirada).
+    Ro'yxat doim tartibning aniq prefiksi bo'lib qoladi: kalitlari prefiksdan
+    pastga tushgan kino chiqariladi, chunki uning o'rnida bazadagi boshqa kino
+    bo'lishi mumkin. Birinchi sahifaga yetmay qolsa — ro'yxat eskirgan (stale)
+    va bazadan qayta yuklanadi. Birinchi sahifa o'zgargandagina versiya oshadi,
+    tayyor javob (render) shu versiya bo'yicha keshlanadi.
+    """
+
+    def __init__(
+        self,
+        sort_key: Callable[[BoardEntry], tuple],
+        capacity: int = 30,
+        page_size: int = 10,
+        accepts: Optional[Callable[[BoardEntry], bool]] = None
+    ):
+        self.sort_key = sort_key
+        self.capacity = max(capacity, page_size + 1)
+        self.page_size = page_size
+        self.accepts = accepts
+
+        self._entries: List[BoardEntry] = []
+        # Bazadagi barcha mos kinolar ro'yxatdami
+        self._exhausted = False
+        self.loaded = False
+        self.version = 0
+        self._rendered: Optional[Tuple[int, Any]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stale(self) -> bool:
+        return not self.loaded or (not self._exhausted and len(self._entries) <= self.page_size)
+
+    def load(self, entries: List[BoardEntry]):
+        """Bazadan o'qilgan (tartiblangan, ko'pi bilan capacity ta) qatorlar"""
+        before = self._snapshot()
+        self._entries = list(entries[:self.capacity])
+        self._exhausted = len(entries) < self.capacity
+        self.loaded = True
+        self._bump_if_changed(before)
+
+    def offer(self, entry: BoardEntry):
+        """Kino qo'shildi yoki o'zgardi (faol bo'lmasa — remove chaqiriladi)"""
+        if not self.loaded:
+            return
+        if self.accepts is not None and not self.accepts(entry):
+            self.remove(entry.id)
+            return
+
+        before = self._snapshot()
+        entries = [e for e in self._entries if e.id != entry.id]
+        key = self.sort_key(entry)
+        if self._exhausted or (entries and key > self.sort_key(entries[-1])):
+            entries.append(entry)
+            entries.sort(key=self.sort_key, reverse=True)
+            if len(entries) > self.capacity:
+                del entries[self.capacity:]
+                self._exhausted = False
+        self._entries = entries
+        self._bump_if_changed(before)
+
+    def remove(self, movie_id: int):
+        if not any(e.id == movie_id for e in self._entries):
+            return
+        before = self._snapshot()
+        self._entries = [e for e in self._entries if e.id != movie_id]
+        self._bump_if_changed(before)
+
+    def page(self) -> Tuple[List[Tuple[BoardEntry, tuple]], bool]:
+        """Birinchi sahifa: ([(kino, kalit)], yana sahifa bormi)"""
+        rows = [(entry, self.sort_key(entry)) for entry in self._entries[:self.page_size]]
+        return rows, len(self._entries) > self.page_size
+
+    def render(self, build: Callable[[List[Tuple[BoardEntry, tuple]], bool], Any]) -> Any:
+        """build(qatorlar, has_more) natijasi versiya o'zgarguncha keshlanadi"""
+        rendered = self._rendered
+        if rendered is None or rendered[0] != self.version:
+            rendered = self._rendered = (self.version, build(*self.page()))
+        return rendered[1]
+
+    def _snapshot(self) -> tuple:
+        return tuple(self._entries[:self.page_size]), len(self._entries) > self.page_size
+
+    def _bump_if_changed(self, before: tuple):
+        if self._snapshot() != before:
+            self.version += 1
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'exhausted': self._exhausted,
+            'version': self.version
+        }
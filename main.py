@@ -1,7 +1,8 @@
 import asyncio
 import logging
+from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, BotCommand
+from aiogram.types import Message, CallbackQuery, BotCommand, ChatMemberUpdated
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
@@ -10,7 +11,12 @@ from config import config
 from database import Database
 from admin import router as admin_router
 from user_handlers import router as user_router
-from utils import check_subscription, format_movie_info, send_movie_with_caption, validate_movie_code
+from middlewares import ActivityMiddleware
+from utils import (
+    check_subscription, get_movie_caption, send_movie_with_caption,
+    validate_movie_code, invite_link_refresher, membership_cache,
+    membership_store, record_channel_member, get_bot_username
+)
 from keyboards import get_main_menu_kb, get_movie_actions_kb
 
 logging.basicConfig(
@@ -24,6 +30,9 @@ logger = logging.getLogger(__name__)
 bot = Bot(token=config.BOT_TOKEN)
 dp = Dispatcher(bot)
 
+# Fon vazifalari (shutdown'da to'xtatiladi)
+background_tasks = []
+
 # --- Asosiy Handlerlar ---
 
 @dp.message(CommandStart())
@@ -31,13 +40,6 @@ async def cmd_start(message: Message, db: Database, state: FSMContext):
     """Start buyrug'i"""
     await state.clear()
     
-    # Foydalanuvchini bazaga qo'shish
-    await db.add_user(
-        message.from_user.id,
-        message.from_user.username or "",
-        message.from_user.first_name or ""
-    )
-    
     # Obuna tekshirish
     is_subscribed, kb = await check_subscription(message.from_user.id, db, bot)
     
@@ -68,7 +70,8 @@ async def cmd_start(message: Message, db: Database, state: FSMContext):
 @dp.callback_query(F.data == "check_fsub")
 async def check_subscription_callback(call: CallbackQuery, db: Database):
     """Obuna tekshirish callback"""
-    is_subscribed, kb = await check_subscription(call.from_user.id, db, bot)
+    # Foydalanuvchi endi obuna bo'lgan bo'lishi mumkin — keshni chetlab o'tamiz
+    is_subscribed, kb = await check_subscription(call.from_user.id, db, bot, refresh=True)
     
     if is_subscribed:
         await call.message.edit_text(
@@ -82,6 +85,18 @@ async def check_subscription_callback(call: CallbackQuery, db: Database):
         await call.answer("❌ Hali barcha kanallarga obuna bo'lmadingiz!", show_alert=True)
         await call.message.edit_reply_markup(reply_markup=kb)
 
+@dp.chat_member()
+async def channel_member_update(update: ChatMemberUpdated, db: Database):
+    """Majburiy kanallardagi a'zolik o'zgarishlarini kuzatish"""
+    channels = await db.get_required_channels()
+    if update.chat.id not in {ch.channel_id for ch in channels}:
+        return
+    
+    user_id = update.new_chat_member.user.id
+    is_member = update.new_chat_member.status not in ['left', 'kicked']
+    membership_cache.pop((user_id, update.chat.id))
+    await record_channel_member(db, update.chat.id, user_id, is_member)
+
 @dp.message(F.text.isdigit())
 async def handle_movie_code(message: Message, db: Database, state: FSMContext):
     """Kino kodini qayta ishlash"""
@@ -109,9 +124,9 @@ async def send_movie_to_user(user_id: int, movie_code: int, db: Database):
         )
         return
     
-    # Kinoni topish
-    movie = await db.get_movie_by_code(movie_code)
-    if not movie:
+    # Kinoni topish, ko'rishni qayd qilish va reytinglar — bitta so'rovda
+    card = await db.get_movie_card(movie_code, user_id)
+    if not card:
         await bot.send_message(
             user_id,
             f"❌ <code>{movie_code}</code> kodli kino topilmadi.\n\n"
@@ -121,15 +136,10 @@ async def send_movie_to_user(user_id: int, movie_code: int, db: Database):
         )
         return
     
-    # Ko'rishni qayd qilish
-    await db.add_movie_view(user_id, movie.id)
-    
-    # Reytingni olish
-    rating = await db.get_movie_rating(movie.id)
-    user_rating = await db.get_user_movie_rating(user_id, movie.id)
+    movie, rating, user_rating = card
     
     # Ma'lumotlarni formatlash
-    caption = format_movie_info(movie, rating, include_stats=True)
+    caption = get_movie_caption(movie, rating)
     
     # Kinoni yuborish
     try:
@@ -138,7 +148,7 @@ async def send_movie_to_user(user_id: int, movie_code: int, db: Database):
             user_id,
             movie,
             caption,
-            reply_markup=get_movie_actions_kb(movie_code, bool(user_rating))
+            reply_markup=get_movie_actions_kb(movie_code, user_rating is not None)
         )
         logger.info(f"User {user_id} kinoni ko'rdi: {movie.title} (kod: {movie_code})")
     except Exception as e:
@@ -158,6 +168,7 @@ async def set_bot_commands():
         BotCommand(command="search", description="Kino qidirish"),
         BotCommand(command="top", description="Top kinolar"),
         BotCommand(command="new", description="Yangi kinolar"),
+        BotCommand(command="rated", description="Eng yuqori baholangan kinolar"),
         BotCommand(command="stats", description="Statistika"),
         BotCommand(command="admin", description="Admin panel (faqat admin)"),
     ]
@@ -173,10 +184,36 @@ async def on_startup():
     await db.init_db()
     logger.info("Database tayyor")
     
+    # Kanal a'zoligi jadvalini xotiraga yuklash (faqat hali ishonchli yozuvlar)
+    membership_store.load(await db.get_channel_members(
+        since=datetime.utcnow() - timedelta(seconds=config.MEMBERSHIP_VERIFY_TTL)
+    ))
+    logger.info(f"A'zolik jadvali yuklandi: {membership_store.stats()}")
+    
+    # Inline qidiruv indeksi
+    await db.rebuild_catalog()
+    logger.info(f"Katalog indeksi yuklandi: {db.catalog.stats()}")
+    
+    # Top/yangi/top baholangan ro'yxatlar
+    await db.reconcile_leaderboards()
+    
+    # Bot identifikatori (inline va deep-link havolalar uchun)
+    logger.info(f"Bot: @{await get_bot_username(bot)}")
+    
     # Bot buyruqlari
     await set_bot_commands()
     logger.info("Bot buyruqlari o'rnatildi")
     
+    # Fon vazifalari
+    background_tasks.append(asyncio.create_task(invite_link_refresher(bot, db)))
+    background_tasks.append(asyncio.create_task(db.view_buffer.run()))
+    background_tasks.append(asyncio.create_task(db.run_view_counter_fold()))
+    background_tasks.append(asyncio.create_task(db.run_view_maintenance()))
+    background_tasks.append(asyncio.create_task(db.run_user_activity_flush()))
+    background_tasks.append(asyncio.create_task(db.run_activity_flush()))
+    background_tasks.append(asyncio.create_task(db.run_catalog_rebuild()))
+    background_tasks.append(asyncio.create_task(db.run_leaderboard_reconcile()))
+    
     # Admin xabarnoma
     try:
         await bot.send_message(config.ADMIN_ID, "✅ Bot muvaffaqiyatli ishga tushdi!")
@@ -189,6 +226,14 @@ async def on_shutdown():
     """Bot to'xtaganda"""
     logger.info("Bot to'xtatilmoqda...")
     
+    for task in background_tasks:
+        task.cancel()
+    # Vazifalar tugashini kutamiz: boshlangan yozuvlar (shield) close() dan oldin tugaydi
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    
+    # Buferdagi ko'rishlarni yozib, bazani yopish
+    await db.close()
+    
     # Admin xabarnoma
     try:
         await bot.send_message(config.ADMIN_ID, "⚠️ Bot to'xtatildi!")
@@ -210,6 +255,9 @@ async def main():
     dp["db"] = db
     dp["config"] = config
     
+    # Har bir update'da foydalanuvchi faolligini qayd qilish
+    dp.update.outer_middleware(ActivityMiddleware())
+    
     # Startup va shutdown
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
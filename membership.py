@@ -0,0 +1,95 @@
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class MembershipStore:
+    """
+    Majburiy kanallar a'zoligining xotiradagi jadvali.
+    chat_member yangilanishlari va Telegram'dan olingan javoblar bilan to'ldiriladi,
+    shuning uchun ma'lum foydalanuvchilar uchun tekshirish API so'rovisiz bajariladi.
+    Holat verify_ttl soniyagacha ishonchli: bot yangilanishni o'tkazib yuborgan
+    bo'lishi mumkin, shuning uchun keyin Telegram'dan qayta tekshiriladi.
+    Eskirgan yozuvlar davriy tashlanadi — jadval hajmi shu muddatda faol
+    bo'lgan foydalanuvchilar soni bilan chegaralangan.
+    """
+
+    def __init__(self, verify_ttl: float = 24 * 3600):
+        self.verify_ttl = verify_ttl
+        # channel_id -> {user_id: oxirgi tasdiqlangan vaqt (unix)}
+        self._members: Dict[int, Dict[int, float]] = {}
+        self._left: Dict[int, Dict[int, float]] = {}
+        self._pruned_at = time.time()
+        self.loaded = False
+
+    def get(self, channel_id: int, user_id: int) -> Optional[bool]:
+        """True/False — ma'lum holat, None — noma'lum yoki qayta tekshirilishi kerak"""
+        expired_before = time.time() - self.verify_ttl
+        verified_at = self._members.get(channel_id, {}).get(user_id)
+        if verified_at is not None:
+            return True if verified_at > expired_before else None
+        verified_at = self._left.get(channel_id, {}).get(user_id)
+        if verified_at is not None:
+            return False if verified_at > expired_before else None
+        return None
+
+    def set(self, channel_id: int, user_id: int, is_member: bool, verified_at: float = None):
+        now = time.time()
+        if verified_at is None:
+            verified_at = now
+        members = self._members.setdefault(channel_id, {})
+        left = self._left.setdefault(channel_id, {})
+        if is_member:
+            members[user_id] = verified_at
+            left.pop(user_id, None)
+        else:
+            left[user_id] = verified_at
+            members.pop(user_id, None)
+
+        # Har verify_ttl/4 da bir marta eskirganlarni tozalash
+        if now - self._pruned_at >= self.verify_ttl / 4:
+            self.prune(now)
+
+    def prune(self, now: float = None) -> int:
+        """verify_ttl'dan eski yozuvlarni tashlash. Tashlanganlar sonini qaytaradi"""
+        now = time.time() if now is None else now
+        expired_before = now - self.verify_ttl
+        removed = 0
+        for table in (self._members, self._left):
+            for users in table.values():
+                expired = [user_id for user_id, verified_at in users.items() if verified_at <= expired_before]
+                for user_id in expired:
+                    del users[user_id]
+                removed += len(expired)
+        self._pruned_at = now
+        return removed
+
+    def load(self, rows: Iterable[Tuple[int, int, bool, datetime]]):
+        """Bazadagi (channel_id, user_id, is_member, updated_at) qatorlaridan to'ldirish"""
+        self._members.clear()
+        self._left.clear()
+        expired_before = time.time() - self.verify_ttl
+        for channel_id, user_id, is_member, updated_at in rows:
+            verified_at = (updated_at - _EPOCH).total_seconds() if updated_at else 0.0
+            if verified_at > expired_before:
+                self.set(channel_id, user_id, is_member, verified_at)
+        self.loaded = True
+
+    def drop_channel(self, channel_id: int):
+        self._members.pop(channel_id, None)
+        self._left.pop(channel_id, None)
+
+    def stats(self) -> dict:
+        expired_before = time.time() - self.verify_ttl
+        return {
+            'channels': len(self._members),
+            'members': sum(len(m) for m in self._members.values()),
+            'unverified': sum(
+                1 for table in (self._members, self._left)
+                for users in table.values() for verified_at in users.values()
+                if verified_at <= expired_before
+            ),
+            'left': sum(len(s) for s in self._left.values())
+        }
@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Har bir update'da foydalanuvchi faolligini xotirada qayd qiladi.
+    Bazaga yozish Database.run_user_activity_flush orqali partiyalab bajariladi.
+    """
+
+    # Kanal a'zoligi o'zgarishlari botdan foydalanish emas
+    SKIPPED_UPDATES = {"chat_member", "my_chat_member"}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        db = data.get("db")
+        if (
+            user and db and not user.is_bot
+            and isinstance(event, Update) and event.event_type not in self.SKIPPED_UPDATES
+        ):
+            db.touch_user(user.id, user.username or "", user.first_name or "")
+        return await handler(event, data)
@@ -0,0 +1,257 @@
+import heapq
+import math
+import sys
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from translit import normalize
+
+
+class CatalogHit(NamedTuple):
+    """Qidiruv natijasi (inline javob uchun kerakli maydonlar)"""
+    id: int
+    code: int
+    title: str
+    genre: str
+    quality: str
+    views_count: int
+    rating_sum: int
+    rating_count: int
+    score: float
+
+    @property
+    def rating(self) -> Tuple[float, int]:
+        if not self.rating_count:
+            return 0.0, 0
+        return round(self.rating_sum / self.rating_count, 1), self.rating_count
+
+
+def _word_trigrams(word: str, is_prefix: bool) -> Iterable[str]:
+    # pg_trgm kabi: so'z boshiga ikki, oxiriga bitta bo'shliq
+    padded = f"  {word} "
+    end = len(padded) - 2
+    if is_prefix:
+        # Oxirgi so'z hali yozilmoqda — "so'z oxiri" trigrammasi olinmaydi
+        end -= 1
+    return (padded[i:i + 3] for i in range(end))
+
+
+def trigrams(text: str, prefix: bool = False) -> Set[str]:
+    """Normalizatsiya qilingan matn trigrammalari; prefix=True — oxirgi so'z prefiks"""
+    words = text.split()
+    result = set()
+    for i, word in enumerate(words):
+        result.update(_word_trigrams(word, prefix and i == len(words) - 1))
+    return result
+
+
+def encode_cursor(hit: CatalogHit) -> str:
+    """Inline next_offset: "score:id" (64 baytdan qisqa)"""
+    return f"{hit.score!r}:{hit.id}"
+
+
+def decode_cursor(offset: str) -> Optional[Tuple[float, int]]:
+    """Bo'sh offset — birinchi sahifa; noto'g'ri format uchun ValueError"""
+    if not offset:
+        return None
+    score, movie_id = offset.split(":")
+    return float(score), int(movie_id)
+
+
+class CatalogIndex:
+    """
+    Faol kinolar bo'yicha xotiradagi qidiruv indeksi: nom trigrammalari
+    (xatolarga chidamli) va nom, janr, davlat so'zlari (prefiks bo'yicha,
+    bazadagi search_vector kabi; tavsif xotirani tejash uchun kiritilmagan).
+    Har bir kino zich slot raqamiga ega; ustunlar va postinglar array'larda,
+    takrorlanuvchi satrlar (janr, sifat) intern qilingan. O'chirilgan/yangilangan
+    kinolarning eski slotlari o'lik deb belgilanadi va qayta qurishda tozalanadi.
+    """
+
+    # Bitta harf bilan boshlanadigan so'zlar katalogning katta qismi — qidirilmaydi
+    MIN_QUERY_LENGTH = 2
+
+    def __init__(self, similarity_threshold: float = 0.5, similarity_weight: float = 1.0, views_weight: float = 0.02):
+        self.similarity_threshold = similarity_threshold
+        self.similarity_weight = similarity_weight
+        self.views_weight = views_weight
+
+        self._postings: Dict[str, array] = {}
+        # So'z -> slotlar; _words prefiks qidiruvi uchun tartiblangan lug'at
+        self._word_postings: Dict[str, array] = {}
+        self._words: List[str] = []
+        self._slots: Dict[int, int] = {}  # movie_id -> slot
+        self._alive = bytearray()
+        self._ids = array('I')
+        self._codes = array('q')
+        self._views = array('I')
+        # Faqat so'z bo'yicha mos kelganlar bali (o'xshashlik 0) — oldindan hisoblanadi
+        self._popularity = array('d')
+        self._rating_sums = array('I')
+        self._rating_counts = array('I')
+        self._titles: List[str] = []
+        self._genres: List[str] = []
+        self._qualities: List[str] = []
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def upsert(self, movie):
+        """Kinoni qo'shish yoki yangilash (faol bo'lmasa — olib tashlash)"""
+        self.remove(movie.id)
+        if not movie.is_active:
+            return
+
+        slot = len(self._ids)
+        self._slots[movie.id] = slot
+        self._alive.append(1)
+        self._ids.append(movie.id)
+        self._codes.append(movie.code)
+        views = max(movie.views_count or 0, 0)
+        self._views.append(views)
+        self._popularity.append(round(math.log1p(views) * self.views_weight, 6))
+        self._rating_sums.append(movie.rating_sum or 0)
+        self._rating_counts.append(movie.rating_count or 0)
+        self._titles.append(movie.title)
+        self._genres.append(sys.intern(movie.genre or ""))
+        self._qualities.append(sys.intern(movie.quality or ""))
+
+        title = normalize(movie.title)
+        for gram in trigrams(title):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[sys.intern(gram)] = array('I')
+            postings.append(slot)
+
+        text = " ".join(filter(None, (title, normalize(movie.genre), normalize(movie.country))))
+        for word in set(text.split()):
+            postings = self._word_postings.get(word)
+            if postings is None:
+                word = sys.intern(word)
+                postings = self._word_postings[word] = array('I')
+                insort(self._words, word)
+            postings.append(slot)
+
+    def remove(self, movie_id: int):
+        slot = self._slots.pop(movie_id, None)
+        if slot is not None:
+            self._alive[slot] = 0
+
+    def set_rating(self, movie_id: int, rating_sum: int, rating_count: int):
+        slot = self._slots.get(movie_id)
+        if slot is not None:
+            self._rating_sums[slot] = rating_sum
+            self._rating_counts[slot] = rating_count
+
+    def search(self, query: str, limit: int = 20, after: Optional[Tuple[float, int]] = None) -> List[CatalogHit]:
+        """
+        Nomga o'xshashlik x ommaboplik bo'yicha eng yaxshi `limit` ta kino.
+        So'zlari prefiks bo'yicha mos kelgan (masalan, janr so'rovi) kinolar ham
+        qaytadi — ular uchun o'xshashlik 0, tartibni ommaboplik belgilaydi.
+        Tartib (score kamayish, id o'sish) bo'yicha barqaror; `after` — oldingi
+        sahifaning oxirgi (score, id) jufti (keyset sahifalash).
+        """
+        normalized = normalize(query)
+        if len(normalized) < self.MIN_QUERY_LENGTH:
+            return []
+        grams = trigrams(normalized, prefix=True)
+
+        # Kamida `required` ta trigramma mos kelishi kerak. Bunday kino eng kam
+        # uchraydigan (len - required + 1) ta posting ro'yxatidan kamida bittasida bor,
+        # shuning uchun nomzodlar faqat shulardan olinadi, qolganlari bisect bilan tekshiriladi
+        lists = sorted((self._postings.get(gram, array('I')) for gram in grams), key=len)
+        total = len(lists)
+        required = total if total <= 3 else math.ceil(total * self.similarity_threshold)
+        seed_count = total - required + 1
+
+        hits = Counter()
+        for postings in lists[:seed_count]:
+            hits.update(postings)
+
+        alive = self._alive
+        similar = {}
+        for slot, shared in hits.items():
+            if not alive[slot]:
+                continue
+            for postings in lists[seed_count:]:
+                index = bisect_left(postings, slot)
+                if index < len(postings) and postings[index] == slot:
+                    shared += 1
+            if shared >= required:
+                similar[slot] = shared
+
+        scored = []
+        for slot, shared in similar.items():
+            # Yaxlitlangan qiymat kursorda aynan shu ko'rinishda qaytadi
+            score = round(
+                shared / total * self.similarity_weight
+                + math.log1p(self._views[slot]) * self.views_weight,
+                6
+            )
+            movie_id = self._ids[slot]
+            if after is not None and (score > after[0] or (score == after[0] and movie_id <= after[1])):
+                continue
+            scored.append((score, -movie_id, slot))
+
+        # Keng so'rovlarda (masalan, janr) minglab kino — faqat tayyor ball bilan saralanadi
+        popularity, ids = self._popularity, self._ids
+        word_only = (
+            (popularity[slot], -ids[slot], slot)
+            for slot in self._word_matches(normalized)
+            if alive[slot] and slot not in similar
+        )
+        if after is not None:
+            word_only = (
+                item for item in word_only
+                if item[0] < after[0] or (item[0] == after[0] and -item[1] > after[1])
+            )
+        scored.extend(heapq.nlargest(limit, word_only))
+
+        return [self._hit(slot, score) for score, _, slot in heapq.nlargest(limit, scored)]
+
+    def _word_matches(self, normalized: str) -> Set[int]:
+        """Har bir so'rov so'zi biror so'zning prefiksi bo'lgan slotlar (to_tsquery 'a:* & b:*')"""
+        result = None
+        for term in normalized.split():
+            slots = set()
+            start = bisect_left(self._words, term)
+            for word in self._words[start:]:
+                if not word.startswith(term):
+                    break
+                slots.update(self._word_postings[word])
+            result = slots if result is None else result & slots
+            if not result:
+                return set()
+        return result or set()
+
+    def _hit(self, slot: int, score: float) -> CatalogHit:
+        return CatalogHit(
+            id=self._ids[slot],
+            code=self._codes[slot],
+            title=self._titles[slot],
+            genre=self._genres[slot],
+            quality=self._qualities[slot],
+            views_count=self._views[slot],
+            rating_sum=self._rating_sums[slot],
+            rating_count=self._rating_counts[slot],
+            score=score
+        )
+
+    def load(self, movies: Iterable):
+        """Bazadagi faol kinolardan to'ldirish"""
+        for movie in movies:
+            self.upsert(movie)
+        self.loaded = True
+
+    def stats(self) -> dict:
+        dead = len(self._alive) - len(self._slots)
+        return {
+            'movies': len(self._slots),
+            'dead_slots': dead,
+            'trigrams': len(self._postings),
+            'postings': sum(len(p) for p in self._postings.values()),
+            'words': len(self._words)
+        }
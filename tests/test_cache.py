@@ -0,0 +1,43 @@
+import cache
+from cache import TTLCache
+
+
+def test_get_set_and_stats():
+    c = TTLCache(maxsize=10, ttl=60)
+    assert c.get("a") is None
+    c.set("a", 1)
+    assert c.get("a") == 1
+    assert c.get("b", "x") == "x"
+    stats = c.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 2, 1)
+
+
+def test_lru_eviction_keeps_recently_used():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.evictions == 1
+
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    c.set("b", 2, ttl=60)
+    now[0] += 10
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    assert len(c) == 1
+
+
+def test_falsy_values_are_cached():
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set("a", False)
+    assert c.get("a", "missing") is False
+    assert c.pop("a") is False
+    assert c.pop("a", "missing") == "missing"
@@ -0,0 +1,44 @@
+import pytest
+
+from hll import HyperLogLog
+
+
+@pytest.mark.parametrize("n", [0, 100, 5000, 200_000])
+def test_count_within_error(n):
+    sketch = HyperLogLog(14)
+    for value in range(n):
+        sketch.add(value)
+    # 1.04 / sqrt(2 ** 14) ~ 0.8%; 4 sigma zaxira
+    assert abs(sketch.count() - n) <= max(2, n * 0.04)
+
+
+def test_duplicates_do_not_increase_count():
+    sketch = HyperLogLog(12)
+    for _ in range(10):
+        for value in range(1000):
+            sketch.add(value)
+    assert abs(sketch.count() - 1000) <= 40
+
+
+def test_union_equals_sketch_of_all_values():
+    a, b, both = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    for value in range(0, 3000):
+        a.add(value)
+        both.add(value)
+    for value in range(2000, 6000):
+        b.add(value)
+        both.add(value)
+    union = HyperLogLog.union([a, b], precision=12)
+    assert union.registers == both.registers
+
+
+def test_bytes_round_trip_and_validation():
+    sketch = HyperLogLog(10)
+    for value in range(500):
+        sketch.add(value)
+    restored = HyperLogLog(10, sketch.to_bytes())
+    assert restored.count() == sketch.count()
+    with pytest.raises(ValueError):
+        HyperLogLog(10, b"\0" * 10)
+    with pytest.raises(ValueError):
+        sketch.merge(HyperLogLog(11))
@@ -0,0 +1,105 @@
+import random
+from datetime import datetime
+
+from leaderboard import BoardEntry, Leaderboard
+
+
+def entry(movie_id, views, rating_sum=0, rating_count=0):
+    return BoardEntry(movie_id, movie_id, f"Film {movie_id}", "Drama", "HD",
+                      views, rating_sum, rating_count, datetime(2024, 1, 1))
+
+
+def by_views(e):
+    return e.views_count, e.id
+
+
+def board_from(movies, capacity=6, page_size=3, **kwargs):
+    board = Leaderboard(by_views, capacity=capacity, page_size=page_size, **kwargs)
+    board.load(sorted(movies.values(), key=by_views, reverse=True)[:board.capacity])
+    return board
+
+
+def expected_prefix(movies, board):
+    ordered = sorted(movies.values(), key=by_views, reverse=True)
+    return ordered[:len(board)]
+
+
+def test_offer_keeps_exact_prefix_under_random_updates():
+    rng = random.Random(7)
+    movies = {i: entry(i, rng.randrange(100)) for i in range(1, 40)}
+    board = board_from(movies)
+
+    for _ in range(2000):
+        movie_id = rng.randrange(1, 45)
+        if rng.random() < 0.1 and movie_id in movies:
+            del movies[movie_id]
+            board.remove(movie_id)
+        else:
+            movies[movie_id] = entry(movie_id, rng.randrange(100))
+            board.offer(movies[movie_id])
+
+        if board.stale:
+            board.load(sorted(movies.values(), key=by_views, reverse=True)[:board.capacity])
+        assert board._entries == expected_prefix(movies, board)
+
+
+def test_exhausted_board_accepts_everything():
+    movies = {i: entry(i, i) for i in range(1, 4)}
+    board = board_from(movies, capacity=6)
+    board.offer(entry(10, 0))
+    assert [e.id for e in board._entries] == [3, 2, 1, 10]
+
+
+def test_entry_falling_below_prefix_is_dropped():
+    movies = {i: entry(i, i * 10) for i in range(1, 20)}
+    board = board_from(movies)
+    top = board._entries[0]
+    board.offer(entry(top.id, 0))
+    assert top.id not in {e.id for e in board._entries}
+    assert board._entries == expected_prefix({**movies, top.id: entry(top.id, 0)}, board)
+
+
+def test_shrinking_to_one_page_marks_stale():
+    movies = {i: entry(i, i) for i in range(1, 20)}
+    board = board_from(movies, capacity=5, page_size=3)
+    assert not board.stale
+    for e in list(board._entries[:2]):
+        board.remove(e.id)
+    assert board.stale
+
+
+def test_accepts_filter_removes_entries():
+    board = Leaderboard(by_views, capacity=5, page_size=2, accepts=lambda e: e.rating_count >= 3)
+    board.load([entry(1, 10, 15, 3)])
+    board.offer(entry(1, 10, 15, 2))
+    assert len(board) == 0
+
+
+def test_render_is_cached_until_first_page_changes():
+    movies = {i: entry(i, i * 10) for i in range(1, 20)}
+    board = board_from(movies)
+    calls = []
+
+    def build(rows, has_more):
+        calls.append(1)
+        return [e.id for e, _ in rows], has_more
+
+    assert board.render(build) == ([19, 18, 17], True)
+    # Faqat birinchi sahifadan tashqaridagi o'zgarish
+    board.offer(entry(14, 145))
+    assert board.render(build) == ([19, 18, 17], True)
+    assert len(calls) == 1
+
+    board.offer(entry(1, 1000))
+    assert board.render(build) == ([1, 19, 18], True)
+    assert len(calls) == 2
+
+
+def test_unloaded_board_ignores_offers():
+    board = Leaderboard(by_views)
+    board.offer(entry(1, 1))
+    assert board.stale and len(board) == 0
+
+
+def test_capacity_at_least_one_more_than_page():
+    assert Leaderboard(by_views, capacity=3, page_size=10).capacity == 11
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import membership
+from membership import MembershipStore
+
+
+def test_member_is_rechecked_after_verify_ttl(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(membership.time, "time", lambda: now[0])
+    store = MembershipStore(verify_ttl=60)
+    store.set(1, 10, True)
+    assert store.get(1, 10) is True
+    now[0] += 61
+    assert store.get(1, 10) is None
+    assert store.stats()['unverified'] == 1
+    store.set(1, 10, True)
+    assert store.get(1, 10) is True
+
+
+def test_left_users_and_unknown_users():
+    store = MembershipStore()
+    store.set(1, 10, True)
+    store.set(1, 10, False)
+    assert store.get(1, 10) is False
+    assert store.get(1, 11) is None
+    assert store.get(2, 10) is None
+
+
+def test_load_uses_stored_verification_time():
+    store = MembershipStore(verify_ttl=3600)
+    now = datetime.utcnow()
+    store.load([
+        (1, 10, True, now - timedelta(minutes=5)),
+        (1, 11, True, now - timedelta(hours=2)),
+        (1, 12, False, now),
+    ])
+    assert store.get(1, 10) is True
+    assert store.get(1, 11) is None
+    assert store.get(1, 12) is False
+
+
+def test_drop_channel():
+    store = MembershipStore()
+    store.set(1, 10, True)
+    store.set(1, 11, False)
+    store.drop_channel(1)
+    assert store.get(1, 10) is None and store.get(1, 11) is None
+    assert store.stats()['members'] == 0
+
+
+def test_left_status_also_expires(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(membership.time, "time", lambda: now[0])
+    store = MembershipStore(verify_ttl=60)
+    store.set(1, 10, False)
+    assert store.get(1, 10) is False
+    now[0] += 61
+    assert store.get(1, 10) is None
+
+
+def test_expired_entries_are_pruned(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(membership.time, "time", lambda: now[0])
+    store = MembershipStore(verify_ttl=60)
+    store.set(1, 10, True)
+    store.set(1, 11, False)
+    now[0] += 50
+    store.set(1, 12, True)
+    assert store.stats()['members'] == 2
+    now[0] += 20
+    # set() eskirganlarni vaqti-vaqti bilan o'zi tozalaydi
+    store.set(2, 13, True)
+    stats = store.stats()
+    assert (stats['members'], stats['left'], stats['unverified']) == (2, 0, 0)
+    assert store.get(1, 12) is True
@@ -0,0 +1,102 @@
+from collections import namedtuple
+
+import pytest
+
+from search_index import CatalogIndex, decode_cursor, encode_cursor, trigrams
+
+Movie = namedtuple(
+    "Movie", "id code title genre country quality views_count rating_sum rating_count is_active"
+)
+
+
+def movie(movie_id, title, views=0, is_active=True, genre="Drama", country=None):
+    return Movie(movie_id, 1000 + movie_id, title, genre, country, "HD", views, 0, 0, is_active)
+
+
+@pytest.fixture
+def index():
+    catalog = CatalogIndex()
+    catalog.load([
+        movie(1, "Avengers", views=100),
+        movie(2, "Avengers: Endgame", views=5000),
+        movie(3, "Avatar", views=300),
+        movie(4, "O'tkan kunlar", views=10),
+        movie(5, "Hidden", is_active=False),
+    ])
+    return catalog
+
+
+def test_trigrams_prefix_skips_word_end():
+    assert "on " in trigrams("on")
+    assert "on " not in trigrams("on", prefix=True)
+
+
+def test_search_finds_typos_and_scripts(index):
+    assert {hit.id for hit in index.search("avngers")} == {1, 2}
+    assert [hit.id for hit in index.search("Ўткан")] == [4]
+    assert index.search("a") == []
+
+
+def test_inactive_and_removed_movies_are_hidden(index):
+    assert index.search("hidden") == []
+    index.remove(3)
+    assert 3 not in {hit.id for hit in index.search("avatar")}
+    index.upsert(movie(3, "Avatar 2"))
+    assert [hit.title for hit in index.search("avatar")] == ["Avatar 2"]
+    assert index.stats()['dead_slots'] == 1
+
+
+def test_genre_and_country_words_match_by_prefix():
+    catalog = CatalogIndex()
+    catalog.load([
+        movie(1, "Avatar", views=300, genre="Fantastika, Sarguzasht", country="AQSH"),
+        movie(2, "Sevgi", views=10, genre="Drama, Romantik", country="Turkiya"),
+        movie(3, "Titanik", views=900, genre="Драма", country="AQSH"),
+        movie(4, "Drama Queen", views=0, genre="Komediya"),
+    ])
+    # Nomga mos kelgan kino o'xshashlik hisobiga oldinda, qolganlari ommaboplik bo'yicha
+    assert [hit.id for hit in catalog.search("drama")] == [4, 3, 2]
+    assert [hit.id for hit in catalog.search("dram")] == [4, 3, 2]
+    assert [hit.id for hit in catalog.search("turkiya drama")] == [2]
+    assert [hit.id for hit in catalog.search("fantast")] == [1]
+
+    pages, after = [], None
+    while True:
+        page = catalog.search("drama", limit=1, after=after)
+        if not page:
+            break
+        pages.extend(page)
+        after = decode_cursor(encode_cursor(page[-1]))
+    assert [hit.id for hit in pages] == [4, 3, 2]
+
+
+def test_set_rating(index):
+    index.set_rating(4, 9, 2)
+    hit = index.search("otkan")[0]
+    assert hit.rating == (4.5, 2)
+
+
+def test_cursor_pages_reproduce_full_ranking():
+    catalog = CatalogIndex()
+    catalog.load([movie(i, f"Film {i % 7}", views=i % 5) for i in range(1, 60)])
+    full = catalog.search("film", limit=100)
+    assert len(full) == 59
+
+    pages, after = [], None
+    while True:
+        page = catalog.search("film", limit=8, after=after)
+        if not page:
+            break
+        pages.extend(page)
+        after = decode_cursor(encode_cursor(page[-1]))
+    assert [hit.id for hit in pages] == [hit.id for hit in full]
+
+
+def test_cursor_round_trip():
+    catalog = CatalogIndex()
+    catalog.load([movie(1, "Matrix", views=12345)])
+    hit = catalog.search("matrix")[0]
+    assert decode_cursor(encode_cursor(hit)) == (hit.score, hit.id)
+    assert decode_cursor("") is None
+    with pytest.raises(ValueError):
+        decode_cursor("garbage")
@@ -0,0 +1,21 @@
+import pytest
+
+from translit import normalize
+
+
+@pytest.mark.parametrize("text", ["Oʻtkan kunlar", "Ўткан кунлар", "O'tkan kunlar", "O`TKAN  KUNLAR!"])
+def test_scripts_and_apostrophes_normalize_equally(text):
+    assert normalize(text) == "otkan kunlar"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Qo'rqinchli", "korkinchli"),
+    ("Xayr", "hayr"),
+    ("Khan", "han"),
+    ("Amélie", "amelie"),
+    ("Spider-Man: 2", "spider man 2"),
+    ("", ""),
+    (None, ""),
+])
+def test_folds(text, expected):
+    assert normalize(text) == expected
@@ -0,0 +1,44 @@
+import re
+import unicodedata
+
+# O'zbek va rus kirill harflari -> lotin (qidiruv uchun soddalashtirilgan)
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "s",
+    "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "ў": "o", "қ": "k", "ғ": "g", "ҳ": "h", "і": "i", "є": "e", "ї": "i",
+}
+
+# Yozilishi turlicha bo'ladigan tovushlar bitta shaklga keltiriladi:
+# x/kh/h -> h, q -> k, o'/g' tutuq belgisisiz (belgilar avvalroq olib tashlanadi)
+_FOLDS = (("kh", "h"), ("x", "h"), ("q", "k"))
+
+_APOSTROPHES = "'`’‘ʻʼ′´"
+_APOSTROPHE_RE = re.compile(f"[{_APOSTROPHES}]")
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+_TRANSLATION = str.maketrans(_CYRILLIC)
+
+
+def normalize(text: str) -> str:
+    """
+    Qidiruv uchun matnni yagona ko'rinishga keltirish.
+    Lotin, kirill (o'zbek/rus) yozuvidagi bir xil so'z bir xil natija beradi:
+    "Oʻtkan kunlar", "Ўткан кунлар" va "O'tkan kunlar" -> "otkan kunlar".
+    """
+    if not text:
+        return ""
+
+    text = text.lower().translate(_TRANSLATION)
+    text = _APOSTROPHE_RE.sub("", text)
+
+    if not text.isascii():
+        # Diakritik belgilarni olib tashlash (é -> e)
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+
+    for source, target in _FOLDS:
+        text = text.replace(source, target)
+
+    return _NON_WORD_RE.sub(" ", text).strip()
@@ -1,14 +1,18 @@
 import logging
+from typing import Tuple
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, InlineQueryResultArticle, InputTextMessageContent, InlineQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from config import config
 from database import Database
+from translit import normalize
 from utils import (
     check_subscription, format_movie_info, format_number,
-    get_greeting, validate_rating
+    get_greeting, validate_rating, get_bot_username, inline_results_cache,
+    encode_page_cursor, decode_page_cursor_datetime
 )
 from keyboards import (
     get_main_menu_kb, get_rating_kb, get_genre_kb,
@@ -58,7 +62,7 @@ async def search_movies_handler(message: Message, state: FSMContext, db: Databas
     text = f"🔍 <b>'{query}'</b> bo'yicha {len(movies)} ta natija:\n\n"
     
     for i, movie in enumerate(movies, 1):
-        rating = await db.get_movie_rating(movie.id)
+        rating = movie.rating
         stars = "⭐️" * int(rating[0]) if rating[1] > 0 else "—"
         
         text += (
@@ -72,20 +76,36 @@ async def search_movies_handler(message: Message, state: FSMContext, db: Databas
     await message.answer(text, parse_mode="HTML", reply_markup=get_main_menu_kb())
     await state.clear()
 
-@router.message(F.text == "🎬 Top kinolar")
-@router.message(Command("top"))
-async def top_movies_handler(message: Message, db: Database):
-    """Top kinolar"""
-    movies = await db.get_top_movies(limit=10)
-    
-    if not movies:
-        await message.answer("Hozircha kinolar yo'q.", reply_markup=get_main_menu_kb())
-        return
-    
-    text = "🏆 <b>Top 10 kinolar</b>\n\n"
+def _parse_page_callback(data: str, prefix: str) -> Tuple[bool, int, Tuple[int, int]]:
+    """'{prefix}_{n|p}_{sahifa}_{kalit}_{id}' -> (orqagami, sahifa, kursor)"""
+    direction, page, key, movie_id = data[len(prefix) + 1:].split("_")
+    return direction == "p", max(int(page), 1), (int(key), int(movie_id))
+
+def _resolve_page(page: int, backward: bool, has_more: bool) -> int:
+    """
+    Orqaga o'tishda oldinda qator qolmagan bo'lsa, bu birinchi sahifa: ro'yxat
+    o'zgargan bo'lsa ham raqam 1 dan qayta boshlanadi va hech qachon 1 dan kichik bo'lmaydi
+    """
+    if backward and not has_more:
+        return 1
+    return max(page, 1)
+
+def _page_kb(prefix: str, page: int, rows: list, has_more: bool, backward: bool, back_callback: str = None):
+    """Sahifa qatorlarining chetki kalitlaridan oldingi/keyingi sahifa kursorlari"""
+    has_prev = has_more if backward else page > 1
+    has_next = True if backward else has_more
+    return get_pagination_kb(
+        page,
+        prev_callback=f"{prefix}_p_{page - 1}_{encode_page_cursor(rows[0][1])}" if has_prev else None,
+        next_callback=f"{prefix}_n_{page + 1}_{encode_page_cursor(rows[-1][1])}" if has_next else None,
+        back_callback=back_callback
+    )
+
+def _top_movies_text(rows: list, page: int) -> str:
+    text = f"🏆 <b>Top kinolar</b> — {page}-sahifa\n\n"
     
-    for i, movie in enumerate(movies, 1):
-        rating = await db.get_movie_rating(movie.id)
+    for i, (movie, _) in enumerate(rows, (page - 1) * config.MOVIES_PAGE_SIZE + 1):
+        rating = movie.rating
         stars = "⭐️" * int(rating[0]) if rating[1] > 0 else "—"
         views = format_number(movie.views_count)
         
@@ -96,32 +116,195 @@ async def top_movies_handler(message: Message, db: Database):
             f"   {stars} | 👁 {views} | {movie.genre}\n"
             f"   Kod: <code>{movie.code}</code>\n\n"
         )
+    return text
+
+def _new_movies_text(rows: list, page: int) -> str:
+    text = f"🆕 <b>Yangi qo'shilgan kinolar</b> — {page}-sahifa\n\n"
     
-    await message.answer(text, parse_mode="HTML", reply_markup=get_main_menu_kb())
+    for i, (movie, _) in enumerate(rows, (page - 1) * config.MOVIES_PAGE_SIZE + 1):
+        rating = movie.rating
+        stars = "⭐️" * int(rating[0]) if rating[1] > 0 else "—"
+        
+        text += (
+            f"{i}. <b>{movie.title}</b>\n"
+            f"   {stars} | {movie.genre} | {movie.quality}\n"
+            f"   Kod: <code>{movie.code}</code>\n\n"
+        )
+    return text
+
+@router.message(F.text == "🎬 Top kinolar")
+@router.message(Command("top"))
+async def top_movies_handler(message: Message, db: Database):
+    """Top kinolar (birinchi sahifa xotiradagi ro'yxatdan, tayyor javob keshlangan)"""
+    board = await db.get_leaderboard("top")
+    page = board.render(lambda rows, has_more: rows and (
+        _top_movies_text(rows, 1), _page_kb("top", 1, rows, has_more, False)
+    ))
+    
+    if not page:
+        await message.answer("Hozircha kinolar yo'q.", reply_markup=get_main_menu_kb())
+        return
+    
+    text, kb = page
+    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+@router.callback_query(F.data.startswith("top_"))
+async def top_movies_page_callback(call: CallbackQuery, db: Database):
+    """Top kinolar sahifasi (keyset kursor bo'yicha)"""
+    try:
+        backward, page, cursor = _parse_page_callback(call.data, "top")
+    except ValueError:
+        await call.answer()
+        return
+    
+    rows, has_more = await db.get_top_movies(config.MOVIES_PAGE_SIZE, cursor, backward)
+    if not rows:
+        await call.answer("❌ Boshqa kinolar yo'q", show_alert=True)
+        return
+    page = _resolve_page(page, backward, has_more)
+    
+    await call.message.edit_text(
+        _top_movies_text(rows, page),
+        parse_mode="HTML",
+        reply_markup=_page_kb("top", page, rows, has_more, backward)
+    )
+    await call.answer()
 
 @router.message(F.text == "🆕 Yangi kinolar")
 @router.message(Command("new"))
 async def new_movies_handler(message: Message, db: Database):
-    """Yangi kinolar"""
-    movies = await db.get_recent_movies(limit=10)
+    """Yangi kinolar (birinchi sahifa xotiradagi ro'yxatdan, tayyor javob keshlangan)"""
+    board = await db.get_leaderboard("new")
+    page = board.render(lambda rows, has_more: rows and (
+        _new_movies_text(rows, 1), _page_kb("new", 1, rows, has_more, False)
+    ))
     
-    if not movies:
+    if not page:
         await message.answer("Hozircha kinolar yo'q.", reply_markup=get_main_menu_kb())
         return
     
-    text = "🆕 <b>Yangi qo'shilgan kinolar</b>\n\n"
+    text, kb = page
+    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+@router.callback_query(F.data.startswith("new_"))
+async def new_movies_page_callback(call: CallbackQuery, db: Database):
+    """Yangi kinolar sahifasi (keyset kursor bo'yicha)"""
+    try:
+        backward, page, (added_at, movie_id) = _parse_page_callback(call.data, "new")
+    except ValueError:
+        await call.answer()
+        return
     
-    for i, movie in enumerate(movies, 1):
-        rating = await db.get_movie_rating(movie.id)
+    cursor = (decode_page_cursor_datetime(added_at), movie_id)
+    rows, has_more = await db.get_recent_movies(config.MOVIES_PAGE_SIZE, cursor, backward)
+    if not rows:
+        await call.answer("❌ Boshqa kinolar yo'q", show_alert=True)
+        return
+    page = _resolve_page(page, backward, has_more)
+    
+    await call.message.edit_text(
+        _new_movies_text(rows, page),
+        parse_mode="HTML",
+        reply_markup=_page_kb("new", page, rows, has_more, backward)
+    )
+    await call.answer()
+
+def _rated_movies_text(rows: list) -> str:
+    text = "⭐️ <b>Eng yuqori baholangan kinolar</b>\n\n"
+    
+    for i, (movie, _) in enumerate(rows, 1):
+        avg, count = movie.rating
+        views = format_number(movie.views_count)
+        
+        text += (
+            f"{i}. <b>{movie.title}</b>\n"
+            f"   ⭐️ {avg} ({count} baho) | 👁 {views} | {movie.genre}\n"
+            f"   Kod: <code>{movie.code}</code>\n\n"
+        )
+    return text
+
+@router.message(Command("rated"))
+async def rated_movies_handler(message: Message, db: Database):
+    """Eng yuqori baholangan kinolar (xotiradagi ro'yxatdan)"""
+    board = await db.get_leaderboard("rated")
+    text = board.render(lambda rows, has_more: rows and _rated_movies_text(rows))
+    
+    if not text:
+        await message.answer("Hozircha baholangan kinolar yo'q.", reply_markup=get_main_menu_kb())
+        return
+    
+    await message.answer(text, parse_mode="HTML")
+
+@router.message(F.text == "🎭 Janrlar")
+async def genres_handler(message: Message, db: Database):
+    """Janrlar ro'yxati"""
+    genres = await db.get_genres()
+    
+    if not genres:
+        await message.answer("Hozircha janrlar yo'q.", reply_markup=get_main_menu_kb())
+        return
+    
+    await message.answer("🎭 <b>Janrni tanlang:</b>", parse_mode="HTML", reply_markup=get_genre_kb(genres))
+
+@router.callback_query(F.data == "genres")
+async def genres_callback(call: CallbackQuery, db: Database):
+    """Janr kinolaridan janrlar ro'yxatiga qaytish"""
+    genres = await db.get_genres()
+    await call.message.edit_text("🎭 <b>Janrni tanlang:</b>", parse_mode="HTML", reply_markup=get_genre_kb(genres))
+    await call.answer()
+
+@router.callback_query(F.data.startswith("genre_"))
+async def genre_movies_callback(call: CallbackQuery, db: Database):
+    """Janr kinolari (keyset sahifalab, ko'p ko'rilganidan)"""
+    try:
+        genre_id = int(call.data.split("_")[1])
+        prefix = f"genre_{genre_id}"
+        if call.data == prefix:
+            backward, page, cursor = False, 1, None
+        else:
+            backward, page, cursor = _parse_page_callback(call.data, prefix)
+    except (ValueError, IndexError):
+        await call.answer()
+        return
+    
+    genre = await db.get_genre(genre_id)
+    rows, has_more = await db.get_genre_movies(genre_id, config.MOVIES_PAGE_SIZE, cursor, backward)
+    if genre is None or not rows:
+        await call.answer("❌ Bu janrda kinolar yo'q", show_alert=True)
+        return
+    page = _resolve_page(page, backward, has_more)
+    
+    text = f"🎭 <b>{genre.name}</b> — {page}-sahifa\n\n"
+    
+    for i, (movie, _) in enumerate(rows, (page - 1) * config.MOVIES_PAGE_SIZE + 1):
+        rating = movie.rating
         stars = "⭐️" * int(rating[0]) if rating[1] > 0 else "—"
+        views = format_number(movie.views_count)
         
         text += (
             f"{i}. <b>{movie.title}</b>\n"
-            f"   {stars} | {movie.genre} | {movie.quality}\n"
+            f"   {stars} | 👁 {views} | {movie.quality}\n"
             f"   Kod: <code>{movie.code}</code>\n\n"
         )
     
-    await message.answer(text, parse_mode="HTML", reply_markup=get_main_menu_kb())
+    await call.message.edit_text(
+        text,
+        parse_mode="HTML",
+        reply_markup=_page_kb(prefix, page, rows, has_more, backward, back_callback="genres")
+    )
+    await call.answer()
+
+@router.callback_query(F.data == "back_to_menu")
+async def back_to_menu_callback(call: CallbackQuery):
+    """Inline menyuni yopib, asosiy menyuga qaytish"""
+    await call.message.delete()
+    await call.message.answer("Asosiy menu:", reply_markup=get_main_menu_kb())
+    await call.answer()
+
+@router.callback_query(F.data == "current_page")
+async def current_page_callback(call: CallbackQuery):
+    """Joriy sahifa tugmasi — hech narsa qilmaydi"""
+    await call.answer()
 
 @router.message(F.text == "📊 Statistika")
 @router.message(Command("stats"))
@@ -157,6 +340,7 @@ async def help_handler(message: Message):
         "/search - Kino qidirish\n"
         "/top - Top kinolar\n"
         "/new - Yangi kinolar\n"
+        "/rated - Eng yuqori baholangan kinolar\n"
         "/stats - Statistika\n"
         "/help - Yordam\n\n"
         "❓ Savollar bo'lsa admin bilan bog'laning."
@@ -228,14 +412,19 @@ async def movie_stats_callback(call: CallbackQuery, db: Database):
         await call.answer("❌ Kino topilmadi!", show_alert=True)
         return
     
-    rating = await db.get_movie_rating(movie.id)
+    rating = movie.rating
+    
+    week_views, week_viewers = await db.get_movie_view_history(movie.id, days=7)
     
     text = f"📊 <b>{movie.title}</b>\n\n"
     text += f"👁 Ko'rishlar: {format_number(movie.views_count)}\n"
+    text += f"📅 So'nggi 7 kun: {format_number(week_views)} ko'rish, {format_number(week_viewers)} tomoshabin\n"
     
     if rating[1] > 0:
         text += f"⭐️ Baho: {'⭐️' * int(rating[0])} ({rating[0]}/5)\n"
         text += f"👥 Baholar soni: {rating[1]}\n"
+        for stars, count in reversed(list(enumerate(movie.rating_histogram, 1))):
+            text += f"   {stars}⭐️ — {count}\n"
     else:
         text += "⭐️ Hali baholanmagan\n"
     
@@ -262,7 +451,7 @@ async def inline_query_handler(inline_query: InlineQuery, db: Database):
             movie = await db.get_movie_by_code(code)
             
             if movie:
-                bot_info = await inline_query.bot.get_me()
+                bot_username = await get_bot_username(inline_query.bot)
                 results = [
                     InlineQueryResultArticle(
                         id=str(movie.id),
@@ -271,42 +460,53 @@ async def inline_query_handler(inline_query: InlineQuery, db: Database):
                         input_message_content=InputTextMessageContent(
                             message_text=f"🎬 {movie.title}\n\n"
                                        f"Kodni kiriting: {movie.code}\n"
-                                       f"yoki: t.me/{bot_info.username}?start=code_{movie.code}"
+                                       f"yoki: t.me/{bot_username}?start=code_{movie.code}"
                         )
                     )
                 ]
-                await inline_query.answer(results, cache_time=60)
+                await inline_query.answer(
+                    results,
+                    cache_time=config.INLINE_CACHE_TIME,
+                    is_personal=config.INLINE_IS_PERSONAL
+                )
                 return
         except (ValueError, IndexError):
             pass
     
-    # Qidiruv
-    movies = await db.search_movies(query, limit=20)
-    
-    if not movies:
-        await inline_query.answer([])
-        return
-    
-    bot_info = await inline_query.bot.get_me()
-    results = []
-    
-    for movie in movies:
-        rating = await db.get_movie_rating(movie.id)
-        stars = "⭐️" * int(rating[0]) if rating[1] > 0 else ""
-        
-        results.append(
-            InlineQueryResultArticle(
-                id=str(movie.id),
-                title=movie.title,
-                description=f"{movie.genre} | {movie.quality} {stars}",
-                input_message_content=InputTextMessageContent(
-                    message_text=f"🎬 <b>{movie.title}</b>\n\n"
-                               f"{movie.genre} | {movie.quality}\n"
-                               f"Kod: <code>{movie.code}</code>\n\n"
-                               f"👉 @{bot_info.username}",
-                    parse_mode="HTML"
-                )
-            )
+    # Bir xil so'rovlar (turli foydalanuvchilardan ham) keshdan javob oladi.
+    # Keyingi sahifalarni Telegram next_offset orqali o'zi so'raydi
+    cache_key = (normalize(query), inline_query.offset)
+    page = inline_results_cache.get(cache_key)
+    if page is None:
+        # Qidiruv (xotiradagi katalog indeksi — bazaga so'rov yo'q)
+        movies, next_offset = await db.search_catalog(
+            query, limit=config.INLINE_PAGE_SIZE, offset=inline_query.offset
         )
-    
-    await inline_query.answer(results, cache_time=300)
+        bot_username = await get_bot_username(inline_query.bot)
+        page = ([_inline_movie_result(movie, bot_username) for movie in movies], next_offset)
+        inline_results_cache.set(cache_key, page)
+    
+    results, next_offset = page
+    await inline_query.answer(
+        results,
+        cache_time=config.INLINE_CACHE_TIME,
+        is_personal=config.INLINE_IS_PERSONAL,
+        next_offset=next_offset
+    )
+
+def _inline_movie_result(movie, bot_username: str) -> InlineQueryResultArticle:
+    rating = movie.rating
+    stars = "⭐️" * int(rating[0]) if rating[1] > 0 else ""
+    
+    return InlineQueryResultArticle(
+        id=str(movie.id),
+        title=movie.title,
+        description=f"{movie.genre} | {movie.quality} {stars}",
+        input_message_content=InputTextMessageContent(
+            message_text=f"🎬 <b>{movie.title}</b>\n\n"
+                       f"{movie.genre} | {movie.quality}\n"
+                       f"Kod: <code>{movie.code}</code>\n\n"
+                       f"👉 @{bot_username}",
+            parse_mode="HTML"
+        )
+    )
@@ -1,58 +1,202 @@
+import asyncio
 import logging
 from typing import Tuple, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Chat, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from database import Database, Movie
+from config import config
+from cache import TTLCache
+from membership import MembershipStore
 
 logger = logging.getLogger(__name__)
 
-async def check_subscription(user_id: int, db: Database, bot: Bot) -> Tuple[bool, Optional[InlineKeyboardMarkup]]:
+# (user_id, channel_id) -> obuna holati
+membership_cache = TTLCache(maxsize=config.MEMBERSHIP_CACHE_SIZE, ttl=config.CACHE_TTL)
+
+# chat_member yangilanishlari bilan yuritiladigan a'zolik jadvali
+membership_store = MembershipStore(verify_ttl=config.MEMBERSHIP_VERIFY_TTL)
+
+# Barcha foydalanuvchilar uchun umumiy limit — flood control'dan himoya
+_membership_semaphore = asyncio.Semaphore(config.MEMBERSHIP_CHECK_CONCURRENCY)
+
+# Obuna bo'linmagan kanallar to'plami -> tayyor klaviatura
+_fsub_kb_cache: dict = {}
+_FSUB_KB_CACHE_SIZE = 256
+
+# Normalizatsiya qilingan inline so'rov -> tayyor natijalar
+inline_results_cache = TTLCache(maxsize=config.INLINE_RESULT_CACHE_SIZE, ttl=config.INLINE_RESULT_CACHE_TTL)
+
+# Kino id -> (versiya, reyting, ko'rishlar, tayyor caption)
+caption_cache = TTLCache(maxsize=config.CAPTION_CACHE_SIZE, ttl=config.CAPTION_CACHE_TTL)
+
+# Bot username'i o'zgarmaydi — get_me bir marta chaqiriladi
+_bot_username: Optional[str] = None
+
+async def get_bot_username(bot: Bot) -> str:
+    """Bot username'i (birinchi chaqiruvda get_me, keyin keshdan)"""
+    global _bot_username
+    if _bot_username is None:
+        _bot_username = (await bot.get_me()).username
+    return _bot_username
+
+async def _get_chat_member(bot: Bot, channel_id: int, user_id: int):
+    """get_chat_member umumiy limit ostida"""
+    async with _membership_semaphore:
+        return await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+
+async def _is_channel_member(
+    bot: Bot,
+    db: Database,
+    user_id: int,
+    channel_id: int,
+    refresh: bool = False
+) -> bool:
+    """Bitta kanal uchun obunani tekshirish (lokal jadval + kesh + Telegram)"""
+    known = membership_store.get(channel_id, user_id)
+    if known is True:
+        return True
+    if known is False and not refresh:
+        return False
+    
+    key = (user_id, channel_id)
+    is_member = membership_cache.get(key)
+    if is_member is not None:
+        return is_member
+    
+    try:
+        # Timeout navbatda kutishni ham o'z ichiga oladi
+        member = await asyncio.wait_for(
+            _get_chat_member(bot, channel_id, user_id),
+            timeout=config.MEMBERSHIP_CHECK_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        # Timeout va xatolik natijalari keshlanmaydi — holat noma'lum,
+        # ikkalasi ham bir xil siyosatga qarab hal qilinadi
+        logger.warning(f"Kanal tekshirishda timeout {channel_id}")
+        return config.MEMBERSHIP_FAIL_OPEN
+    except Exception as e:
+        logger.warning(f"Kanal tekshirishda xatolik {channel_id}: {e}")
+        return config.MEMBERSHIP_FAIL_OPEN
+    
+    is_member = member.status not in ['left', 'kicked']
+    ttl = config.CACHE_TTL if is_member else config.CACHE_NEGATIVE_TTL
+    membership_cache.set(key, is_member, ttl=ttl)
+    # Keyingi o'zgarishlar chat_member yangilanishi orqali keladi,
+    # a'zolik esa MEMBERSHIP_VERIFY_TTL o'tgach qayta tekshiriladi
+    await record_channel_member(db, channel_id, user_id, is_member)
+    return is_member
+
+async def record_channel_member(db: Database, channel_id: int, user_id: int, is_member: bool):
+    """A'zolik holatini xotiraga va bazaga yozish"""
+    membership_store.set(channel_id, user_id, is_member)
+    try:
+        await db.set_channel_member(channel_id, user_id, is_member)
+    except Exception as e:
+        logger.warning(f"A'zolikni saqlashda xatolik {channel_id}/{user_id}: {e}")
+
+def forget_channel(channel_id: int):
+    """Majburiy kanal o'chirilganda uning a'zolik yozuvlarini tashlash"""
+    membership_store.drop_channel(channel_id)
+    # Kesh (user_id, channel_id) bo'yicha — kanal o'chirish kam uchraydi, to'liq tozalanadi
+    membership_cache.clear()
+
+async def check_subscription(
+    user_id: int,
+    db: Database,
+    bot: Bot,
+    refresh: bool = False
+) -> Tuple[bool, Optional[InlineKeyboardMarkup]]:
     """
     Majburiy obuna kanallarini tekshiradi
+    refresh=True bo'lsa foydalanuvchi uchun keshlangan natijalar tashlab yuboriladi
     Returns: (is_subscribed, keyboard)
     """
     channels = await db.get_required_channels()
     if not channels:
         return True, None
     
-    not_subscribed_channels = []
+    if refresh:
+        for ch in channels:
+            membership_cache.pop((user_id, ch.channel_id))
     
-    for ch in channels:
-        try:
-            member = await bot.get_chat_member(chat_id=ch.channel_id, user_id=user_id)
-            if member.status in ['left', 'kicked']:
-                not_subscribed_channels.append(ch)
-        except Exception as e:
-            logger.warning(f"Kanal tekshirishda xatolik {ch.channel_id}: {e}")
-            not_subscribed_channels.append(ch)
+    results = await asyncio.gather(*[
+        _is_channel_member(bot, db, user_id, ch.channel_id, refresh) for ch in channels
+    ])
+    not_subscribed_channels = [
+        ch for ch, is_member in zip(channels, results) if not is_member
+    ]
     
     if not not_subscribed_channels:
         return True, None
     
+    return False, get_fsub_kb(not_subscribed_channels)
+
+def get_fsub_kb(channels) -> InlineKeyboardMarkup:
+    """Obuna klaviaturasi — saqlangan linklardan, API so'rovisiz"""
+    key = tuple((ch.channel_id, ch.title, ch.invite_link) for ch in channels)
+    markup = _fsub_kb_cache.get(key)
+    if markup is not None:
+        return markup
+    
     kb = InlineKeyboardBuilder()
-    for ch in not_subscribed_channels:
-        url_link = await get_channel_invite_link(bot, ch.channel_id)
+    for ch in channels:
+        url_link = ch.invite_link or get_fallback_channel_link(ch.channel_id)
         kb.button(text=f"➕ {ch.title}", url=url_link)
     
     kb.button(text="✅ Obuna bo'ldim, tekshirish", callback_data="check_fsub")
     kb.adjust(1)
     
-    return False, kb.as_markup()
+    if len(_fsub_kb_cache) >= _FSUB_KB_CACHE_SIZE:
+        _fsub_kb_cache.clear()
+    markup = _fsub_kb_cache[key] = kb.as_markup()
+    return markup
 
-async def get_channel_invite_link(bot: Bot, channel_id: int) -> str:
-    """Kanal linkini olish"""
-    try:
-        chat_info = await bot.get_chat(channel_id)
-        if chat_info.username:
-            return f"https://t.me/{chat_info.username}"
-        elif channel_id < 0:
-            return f"https://t.me/c/{str(channel_id)[4:]}"
-    except Exception:
-        pass
+def get_fallback_channel_link(channel_id: int) -> str:
+    """Invite link saqlanmagan kanal uchun zaxira link"""
+    if channel_id < 0:
+        return f"https://t.me/c/{str(channel_id)[4:]}"
     return "https://t.me/"
 
+async def get_channel_invite_link(bot: Bot, chat: Chat) -> Optional[str]:
+    """Kanal linkini olish (kanal qo'shilganda va fon yangilashda)"""
+    if chat.username:
+        return f"https://t.me/{chat.username}"
+    if chat.invite_link:
+        return chat.invite_link
+    
+    # Asosiy link yo'q — yangisini yaratamiz (bot kanalda admin bo'lishi kerak)
+    try:
+        return await bot.export_chat_invite_link(chat.id)
+    except Exception as e:
+        logger.warning(f"Invite link yaratishda xatolik {chat.id}: {e}")
+        return None
+
+async def refresh_invite_links(bot: Bot, db: Database):
+    """Majburiy kanallar linklarini yangilash"""
+    channels = await db.get_required_channels()
+    for ch in channels:
+        try:
+            chat = await bot.get_chat(ch.channel_id)
+        except Exception as e:
+            logger.warning(f"Kanal ma'lumotini olishda xatolik {ch.channel_id}: {e}")
+            continue
+        
+        invite_link = await get_channel_invite_link(bot, chat)
+        if invite_link and invite_link != ch.invite_link:
+            await db.update_channel_invite_link(ch.channel_id, invite_link)
+            logger.info(f"Kanal linki yangilandi {ch.channel_id}: {invite_link}")
+
+async def invite_link_refresher(bot: Bot, db: Database):
+    """Fon vazifasi: linklarni davriy yangilab turish"""
+    while True:
+        try:
+            await refresh_invite_links(bot, db)
+        except Exception as e:
+            logger.error(f"Invite linklarni yangilashda xatolik: {e}")
+        await asyncio.sleep(config.INVITE_LINK_REFRESH_INTERVAL)
+
 def format_movie_info(movie: Movie, rating: Tuple[float, int] = None, include_stats: bool = False) -> str:
     """Kino ma'lumotlarini formatlash"""
     text = f"🎬 <b>{movie.title}</b>\n\n"
@@ -86,12 +230,26 @@ def format_movie_info(movie: Movie, rating: Tuple[float, int] = None, include_st
             text += f"📊 Baho: {stars} ({avg_rating}/5) - {count} ta ovoz\n"
     
     if include_stats:
-        text += f"👁 Ko'rishlar: {movie.views_count}\n"
+        text += f"👁 Ko'rishlar: {format_number(movie.views_count)}\n"
     
     text += f"\n🔢 Kod: <code>{movie.code}</code>"
     
     return text
 
+def get_movie_caption(movie: Movie, rating: Tuple[float, int]) -> str:
+    """
+    Kino yuborishdagi caption (statistika bilan). Matn faqat kino versiyasi,
+    reyting yoki ko'rishlarning ko'rinadigan qiymati (1.2K) o'zgarganda qayta tuziladi.
+    """
+    views = format_number(movie.views_count)
+    cached = caption_cache.get(movie.id)
+    if cached is not None and cached[:3] == (movie.version, rating, views):
+        return cached[3]
+    
+    caption = format_movie_info(movie, rating, include_stats=True)
+    caption_cache.set(movie.id, (movie.version, rating, views, caption))
+    return caption
+
 def format_duration(minutes: int) -> str:
     """Davomiylikni formatlash"""
     if minutes < 60:
@@ -109,6 +267,13 @@ def format_number(num: int) -> str:
     else:
         return f"{num/1000000:.1f}M"
 
+def format_stats_age(refreshed_at: datetime) -> str:
+    """Statistika qachon yig'ilganini ko'rsatish"""
+    seconds = int((datetime.utcnow() - refreshed_at).total_seconds())
+    if seconds < 1:
+        return "Hozirgina yangilandi"
+    return f"{seconds} soniya oldin yangilangan"
+
 def get_greeting() -> str:
     """Vaqtga qarab salomlashish"""
     hour = datetime.now().hour
@@ -187,3 +352,15 @@ def create_progress_bar(current: int, total: int, length: int = 10) -> str:
     bar = '█' * filled + '░' * (length - filled)
     percentage = int((current / total) * 100)
     return f"{bar} {percentage}%"
+
+_EPOCH = datetime(1970, 1, 1)
+
+def encode_page_cursor(key: tuple) -> str:
+    """Keyset kalitini callback_data uchun: (qiymat, id) -> 'qiymat_id' (sana — mikrosoniyalarda)"""
+    return "_".join(
+        str((value - _EPOCH) // timedelta(microseconds=1) if isinstance(value, datetime) else value)
+        for value in key
+    )
+
+def decode_page_cursor_datetime(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=micros)